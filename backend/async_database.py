@@ -0,0 +1,120 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Union, Callable, Tuple
+
+from database import Database, db
+
+
+class AsyncDatabase:
+    """Awaitable counterpart to Database for use inside async request handlers.
+
+    Blocking pymysql calls run on a dedicated thread pool that is sized to the
+    connection pool, so every worker thread can hold a connection and reads for
+    different requests overlap instead of stalling the event loop.
+    """
+
+    def __init__(self, database: Database, max_workers: int = None):
+        self.db = database
+        self.max_workers = max_workers
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    workers = self.max_workers or self.db.pool_settings['max_size']
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="db")
+        return self._executor
+
+    async def run(self, func: Callable, *args, **kwargs):
+        """Run a blocking callable on the database executor and await its result"""
+        loop = asyncio.get_running_loop()
+        # Keep context variables (e.g. per-request state) visible inside the worker thread
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def has_table(self, table_name: str) -> bool:
+        if not self.db.schema_loaded:
+            await self.run(self.db.get_tables)
+        return self.db.has_table(table_name)
+
+    async def has_column(self, table_name: str, column: str) -> bool:
+        if not self.db.schema_loaded:
+            await self.run(self.db.get_tables)
+        return self.db.has_column(table_name, column)
+
+    async def get_tables(self) -> List[str]:
+        if self.db.schema_loaded:
+            return self.db.get_tables()
+        return await self.run(self.db.get_tables)
+
+    async def get_column_names(self, table_name: str) -> List[str]:
+        if self.db.schema_loaded:
+            return self.db.get_column_names(table_name)
+        return await self.run(self.db.get_column_names, table_name)
+
+    async def execute_query(self, query: str, params: tuple = None):
+        return await self.run(self.db.execute_query, query, params)
+
+    # Catalog tables already held in memory are served without a thread hop
+
+    async def get_all(self, table_name: str, limit: int = 1000, offset: int = 0) -> List[Dict[str, Any]]:
+        if self.db.cache.is_warm(table_name):
+            return self.db.get_all(table_name, limit, offset)
+        return await self.run(self.db.get_all, table_name, limit, offset)
+
+    async def get_by_id(self, table_name: str, id_column: str, id_value: Any) -> Optional[Dict[str, Any]]:
+        if self.db.cache.is_warm(table_name):
+            return self.db.get_by_id(table_name, id_column, id_value)
+        return await self.run(self.db.get_by_id, table_name, id_column, id_value)
+
+    async def search(self, table_name: str, column: str, search_term: str, limit: int = 50) -> List[Dict[str, Any]]:
+        if self.db.cache.is_warm(table_name):
+            return self.db.search(table_name, column, search_term, limit)
+        return await self.run(self.db.search, table_name, column, search_term, limit)
+
+    async def fuzzy_search(self, table_name: str, column: str, search_term: str,
+                           limit: int = 50, threshold: float = 0.3) -> List[Tuple[Dict[str, Any], float]]:
+        if self.db.cache.is_warm(table_name):
+            return self.db.fuzzy_search(table_name, column, search_term, limit, threshold)
+        return await self.run(self.db.fuzzy_search, table_name, column, search_term, limit, threshold)
+
+    async def category_search(self, table_name: str, column: str, search_term: str,
+                              limit: int = 100) -> List[Dict[str, Any]]:
+        if self.db.cache.is_warm(table_name):
+            return self.db.category_search(table_name, column, search_term, limit)
+        return await self.run(self.db.category_search, table_name, column, search_term, limit)
+
+    async def full_text_search(self, query: str, tables: List[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        wanted = tables or self.db.cache.tables
+        if all(self.db.cache.is_warm(t) for t in wanted if self.db.cache.is_cacheable(t)):
+            return self.db.full_text_search(query, tables, limit)
+        return await self.run(self.db.full_text_search, query, tables, limit)
+
+    async def get_related(self, table_name: str, foreign_table: str,
+                          foreign_key: str, primary_key_value: Any,
+                          limit: int = 100) -> List[Dict[str, Any]]:
+        return await self.run(self.db.get_related, table_name, foreign_table, foreign_key, primary_key_value, limit)
+
+    async def run_custom_query(self, query: str, params: tuple = None) -> Union[List[Dict[str, Any]], int]:
+        return await self.run(self.db.run_custom_query, query, params)
+
+    async def count(self, table_name: str, where_clause: str = None, params: tuple = None) -> int:
+        return await self.run(self.db.count, table_name, where_clause, params)
+
+    async def get_row_counts(self, refresh: bool = False) -> Dict[str, int]:
+        return await self.run(self.db.get_row_counts, refresh)
+
+
+async_db = AsyncDatabase(db)
@@ -0,0 +1,245 @@
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from search import FullTextIndex, TrigramIndex
+
+# Static reference tables that are loaded from CSV and almost never written
+CATALOG_TABLES = ('ammo', 'armor', 'artifacts', 'beasts', 'food', 'medicine', 'weapons', 'anomalies')
+
+
+def _fold(value: Any) -> Optional[str]:
+    """Approximate MySQL's case-insensitive string comparison"""
+    if value is None:
+        return None
+    return str(value).casefold()
+
+
+class TableSnapshot:
+    """Immutable in-memory copy of one table stored as tuples plus an id index"""
+
+    __slots__ = ('name', 'columns', 'primary_key', 'rows', 'id_index', '_positions', '_text_index',
+                 '_trigram_indexes')
+
+    def __init__(self, name: str, columns: List[str], primary_key: Optional[str], rows: List[Dict[str, Any]]):
+        self.name = name
+        self.columns = tuple(columns)
+        self.primary_key = primary_key
+        self.rows = tuple(tuple(row.get(col) for col in self.columns) for row in rows)
+        self._positions = {col: i for i, col in enumerate(self.columns)}
+        self._text_index = None
+        self._trigram_indexes = {}
+        self.id_index = {}
+        if primary_key in self._positions:
+            key_pos = self._positions[primary_key]
+            for i, row in enumerate(self.rows):
+                self.id_index.setdefault(_fold(row[key_pos]), i)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def position(self, column: str) -> Optional[int]:
+        return self._positions.get(column)
+
+    def as_dict(self, index: int) -> Dict[str, Any]:
+        return dict(zip(self.columns, self.rows[index]))
+
+    def text_index(self) -> FullTextIndex:
+        # Built when the table loads (CatalogCache.table); this is only a fallback
+        if self._text_index is None:
+            self._text_index = FullTextIndex(self.columns, self.rows)
+        return self._text_index
+
+    def trigram_index(self, column: str) -> TrigramIndex:
+        index = self._trigram_indexes.get(column)
+        if index is None:
+            position = self._positions[column]
+            index = TrigramIndex(row[position] for row in self.rows)
+            self._trigram_indexes[column] = index
+        return index
+
+
+class CatalogCache:
+    """Read-through cache for the static catalog tables.
+
+    Whole tables are fetched once through ``loader`` and kept as compact
+    ``TableSnapshot`` objects. Lookups that need a scan (search, lookups by a
+    non-key column) are memoised in a size-bounded LRU of row positions.
+    ``invalidate`` must be called whenever a table is written.
+    """
+
+    def __init__(self,
+                 loader: Callable[[str], Tuple[List[str], Optional[str], List[Dict[str, Any]]]],
+                 tables: Tuple[str, ...] = CATALOG_TABLES,
+                 max_results: int = 512):
+        self.loader = loader
+        self.tables = frozenset(tables)
+        self.max_results = max_results
+
+        self._snapshots = {}
+        self._generations = {table: 0 for table in self.tables}
+        self._load_locks = {table: threading.Lock() for table in self.tables}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0, 'invalidations': 0}
+
+    def is_cacheable(self, table_name: str) -> bool:
+        return table_name in self.tables
+
+    def is_warm(self, table_name: str) -> bool:
+        return table_name in self._snapshots
+
+    def table(self, table_name: str) -> TableSnapshot:
+        snapshot = self._snapshots.get(table_name)
+        if snapshot is not None:
+            return snapshot
+
+        with self._load_locks[table_name]:
+            snapshot = self._snapshots.get(table_name)
+            if snapshot is not None:
+                return snapshot
+            generation = self._generations[table_name]
+            columns, primary_key, rows = self.loader(table_name)
+            snapshot = TableSnapshot(table_name, columns, primary_key, rows)
+            # Index the text now so the first search does not pay for it
+            snapshot.text_index()
+            with self._lock:
+                self._stats['loads'] += 1
+                # Do not install data that was invalidated while it was being read
+                if self._generations[table_name] == generation:
+                    self._snapshots[table_name] = snapshot
+            return snapshot
+
+    def warm(self, tables: List[str] = None) -> None:
+        for table_name in tables or sorted(self.tables):
+            self.table(table_name)
+
+    def invalidate(self, table_name: str = None) -> None:
+        with self._lock:
+            self._stats['invalidations'] += 1
+            targets = self.tables if table_name is None else {table_name} & self.tables
+            for table in targets:
+                self._generations[table] += 1
+                self._snapshots.pop(table, None)
+            for key in [k for k in self._results if k[1] in targets]:
+                del self._results[key]
+
+    def _remember(self, key: tuple, compute: Callable[[], Tuple[int, ...]]) -> Tuple[int, ...]:
+        with self._lock:
+            positions = self._results.get(key)
+            if positions is not None:
+                self._results.move_to_end(key)
+                self._stats['hits'] += 1
+                return positions
+            self._stats['misses'] += 1
+            generation = self._generations[key[1]]
+
+        positions = compute()
+
+        with self._lock:
+            if self._generations[key[1]] == generation:
+                self._results[key] = positions
+                if len(self._results) > self.max_results:
+                    self._results.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return positions
+
+    def get_all(self, table_name: str, limit: int = 1000, offset: int = 0) -> List[Dict[str, Any]]:
+        snapshot = self.table(table_name)
+        end = len(snapshot) if limit is None else offset + limit
+        return [snapshot.as_dict(i) for i in range(max(offset, 0), min(end, len(snapshot)))]
+
+    def get_by_id(self, table_name: str, id_column: str, id_value: Any) -> Optional[Dict[str, Any]]:
+        snapshot = self.table(table_name)
+        if id_column == snapshot.primary_key:
+            index = snapshot.id_index.get(_fold(id_value))
+            return snapshot.as_dict(index) if index is not None else None
+
+        column_pos = snapshot.position(id_column)
+        if column_pos is None:
+            return None
+
+        def compute():
+            target = _fold(id_value)
+            return tuple(i for i, row in enumerate(snapshot.rows) if _fold(row[column_pos]) == target)[:1]
+
+        positions = self._remember(('eq', snapshot.name, id_column, _fold(id_value)), compute)
+        return snapshot.as_dict(positions[0]) if positions else None
+
+    def search(self, table_name: str, column: str, search_term: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Substring match on normalized text (case, homoglyph and transliteration
+        folded), so 'akm' finds 'АКМ-74' and '5.45x39' finds '5.45х39'
+        """
+        snapshot = self.table(table_name)
+        if snapshot.position(column) is None:
+            return []
+
+        def compute():
+            return tuple(snapshot.trigram_index(column).contains(search_term))
+
+        positions = self._remember(('contains', snapshot.name, column, search_term), compute)
+        return [snapshot.as_dict(i) for i in positions[:limit]]
+
+    def fuzzy_search(self, table_name: str, column: str, search_term: str,
+                     limit: int = 50, threshold: float = 0.3) -> List[Tuple[Dict[str, Any], float]]:
+        """Typo-tolerant trigram match; returns (record, similarity) best first"""
+        snapshot = self.table(table_name)
+        if snapshot.position(column) is None:
+            return []
+
+        def compute():
+            return tuple(snapshot.trigram_index(column).fuzzy(search_term, threshold, limit=None))
+
+        matches = self._remember(('fuzzy', snapshot.name, column, search_term, threshold), compute)
+        return [(snapshot.as_dict(i), score) for i, score in matches[:limit]]
+
+    def category_search(self, table_name: str, column: str, search_term: str, limit: int = 100) -> List[Dict[str, Any]]:
+        """Full-text matches best first, then the remaining substring matches on ``column``.
+
+        Full-text search only matches whole tokens (or prefixes of three or
+        more characters), so the substring matches keep short and partial
+        terms finding what they always found.
+        """
+        snapshot = self.table(table_name)
+        positions = [position for position, _, _ in snapshot.text_index().search(search_term, limit)]
+        if len(positions) < limit and snapshot.position(column) is not None:
+            def compute():
+                return tuple(snapshot.trigram_index(column).contains(search_term))
+
+            ranked = set(positions)
+            for position in self._remember(('contains', snapshot.name, column, search_term), compute):
+                if len(positions) >= limit:
+                    break
+                if position not in ranked:
+                    positions.append(position)
+        return [snapshot.as_dict(i) for i in positions]
+
+    def full_text_search(self, query: str, tables: List[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        """Relevance-ranked search over the text columns of one or more catalog tables"""
+        hits = []
+        for table_name in tables or sorted(self.tables):
+            if table_name not in self.tables:
+                continue
+            snapshot = self.table(table_name)
+            for position, score, fields in snapshot.text_index().search(query, limit):
+                hits.append((score, snapshot, position, fields))
+
+        hits.sort(key=lambda hit: -hit[0])
+        results = []
+        for score, snapshot, position, fields in hits[:limit]:
+            record = snapshot.as_dict(position)
+            results.append({
+                "table": snapshot.name,
+                "id": record.get(snapshot.primary_key),
+                "score": score,
+                "matched_fields": fields,
+                "record": record,
+            })
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_results'] = len(self._results)
+            stats['tables'] = {name: len(snapshot) for name, snapshot in self._snapshots.items()}
+        return stats
@@ -1,12 +1,22 @@
 import os
+import re
 import csv
+import json
+import hashlib
 import pymysql
 from pymysql import Error
 import pymysql.cursors
 import logging
 import time
-from typing import List, Dict, Any, Optional, Tuple, Union
+import threading
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple, Union, Iterator
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from catalog_cache import CatalogCache
+from schema_migrations import MigrationRunner
+import instrumentation
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,6 +24,242 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Game state saved by persistence.py and shared_state.py; holds password
+# hashes and emails, so it is also refused by the custom query endpoint
+PRIVATE_TABLES = ('state_records', 'state_claims')
+
+# Bookkeeping tables that are hidden from get_tables() and the wiki
+INTERNAL_TABLES = ('catalog_files', 'catalog_rows', 'schema_version') + PRIVATE_TABLES
+
+# MySQL error codes meaning LOAD DATA LOCAL INFILE is disabled on one side
+LOCAL_INFILE_DISABLED_ERRORS = (1148, 2068, 3948)
+
+
+class PoolTimeout(Error):
+    """Raised when no pooled connection becomes available in time."""
+
+
+class ConnectionPool:
+    """Bounded pool of pymysql connections.
+
+    Keeps between ``min_size`` and ``max_size`` connections open. Borrowed
+    connections are health checked when they sat idle for longer than
+    ``ping_interval`` seconds, idle connections above ``min_size`` are
+    recycled after ``idle_timeout`` seconds (checked whenever a connection
+    is borrowed or returned) and every connection is replaced once it is
+    older than ``max_lifetime`` seconds.
+    """
+
+    def __init__(self,
+                 config: Dict[str, Any],
+                 min_size: int = 2,
+                 max_size: int = 10,
+                 timeout: float = 10.0,
+                 idle_timeout: float = 300.0,
+                 max_lifetime: float = 3600.0,
+                 ping_interval: float = 30.0):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: need 0 <= min_size <= max_size and max_size >= 1")
+
+        self.config = config
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        self._idle = deque()  # (connection, created_at, returned_at)
+        self._created_at = {}  # id(connection) -> creation time of borrowed connections
+        self._size = 0
+        self._closed = False
+        self._lock = threading.Condition()
+
+        self._stats = {
+            'borrowed': 0,
+            'created': 0,
+            'closed': 0,
+            'recycled': 0,
+            'failed_health_checks': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+        }
+
+    def _open(self):
+        conn = pymysql.connect(**self.config)
+        self._count('created')
+        return conn
+
+    def _discard(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._count('closed')
+
+    def _count(self, stat: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[stat] += amount
+
+    def _recycle_expired(self) -> None:
+        with self._lock:
+            expired = self._collect_expired()
+            self._stats['recycled'] += len(expired)
+        for conn in expired:
+            self._discard(conn)
+
+    def fill(self) -> None:
+        """Open connections until the pool holds at least ``min_size``."""
+        while True:
+            with self._lock:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._open()
+            except Exception:
+                with self._lock:
+                    self._size -= 1
+                    self._lock.notify()
+                raise
+            now = time.monotonic()
+            with self._lock:
+                self._idle.append((conn, now, now))
+                self._lock.notify()
+
+    def acquire(self):
+        """Borrow a healthy connection, waiting up to ``timeout`` seconds."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        self._recycle_expired()
+
+        while True:
+            entry = None
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise Error("Connection pool is closed")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"Timed out after {self.timeout}s waiting for a database connection")
+                    waited = True
+                    self._lock.wait(remaining)
+
+            if entry is None:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+                created_at = time.monotonic()
+            else:
+                conn, created_at, returned_at = entry
+                if not self._is_healthy(conn, created_at, returned_at):
+                    self._release_slot(conn)
+                    continue
+
+            wait_time = time.monotonic() - started
+            with self._lock:
+                self._created_at[id(conn)] = created_at
+                self._stats['borrowed'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                self._stats['wait_time_total'] += wait_time
+                self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+            return conn
+
+    def _is_healthy(self, conn, created_at: float, returned_at: float) -> bool:
+        now = time.monotonic()
+        if now - created_at > self.max_lifetime:
+            self._count('recycled')
+            return False
+        if not getattr(conn, 'open', False):
+            self._count('failed_health_checks')
+            return False
+        if now - returned_at > self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self._count('failed_health_checks')
+                return False
+        return True
+
+    def _release_slot(self, conn) -> None:
+        self._discard(conn)
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def release(self, conn, discard: bool = False) -> None:
+        """Return a borrowed connection; broken connections are dropped."""
+        with self._lock:
+            created_at = self._created_at.pop(id(conn), time.monotonic())
+            keep = not (discard or self._closed) and getattr(conn, 'open', False)
+            if keep:
+                self._idle.append((conn, created_at, time.monotonic()))
+                self._lock.notify()
+            else:
+                self._size -= 1
+                self._lock.notify()
+        if keep:
+            self._recycle_expired()
+        else:
+            self._discard(conn)
+
+    def _collect_expired(self) -> list:
+        """Pop idle connections past ``idle_timeout`` while above ``min_size``.
+
+        Must be called with the lock held.
+        """
+        expired = []
+        now = time.monotonic()
+        # Oldest returned connections sit at the left end of the deque
+        while self._idle and self._size > self.min_size:
+            conn, created_at, returned_at = self._idle[0]
+            if now - returned_at <= self.idle_timeout:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            expired.append(conn)
+        return expired
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle = [entry[0] for entry in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        borrowed = stats['borrowed']
+        stats['wait_time_avg'] = stats['wait_time_total'] / borrowed if borrowed else 0.0
+        return stats
+
+
 class Database:
     _instance = None
     
@@ -28,7 +274,13 @@ class Database:
                  user: str = 'ttrpg_user', 
                  password: str = None,
                  database: str = 'TTRPG_DB',
-                 csv_directory: str = '/app/data/import'):
+                 csv_directory: str = '/app/data/import',
+                 pool_min_size: int = 2,
+                 pool_max_size: int = 10,
+                 pool_timeout: float = 10.0,
+                 pool_idle_timeout: float = 300.0,
+                 load_workers: int = 4,
+                 load_chunk_size: int = 5000):
         if self._initialized:
             return
             
@@ -40,188 +292,84 @@ class Database:
             'user': user,
             'password': password,
             'database': database,
-            'cursorclass': pymysql.cursors.DictCursor
+            'cursorclass': pymysql.cursors.DictCursor,
+            'local_infile': True
         }
         self.csv_directory = csv_directory
-        self.connection = None
-        self.cursor = None
+        self.local_infile = True
+        self.load_workers = load_workers
+        self.load_chunk_size = load_chunk_size
+        self.pool_settings = {
+            'min_size': pool_min_size,
+            'max_size': pool_max_size,
+            'timeout': pool_timeout,
+            'idle_timeout': pool_idle_timeout,
+        }
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._schema = None
+        self._schema_lock = threading.Lock()
+        self._row_counts = None
+        self._row_counts_lock = threading.Lock()
+        self.cache = CatalogCache(self._fetch_table)
+        # Bumped on every data change so derived caches can tell they are stale
+        self.data_version = 0
         self._initialized = True
-    def initialize_schema_from_csvs(self) -> bool:
-        """Create database tables based on CSV files available in the data directory"""
-        if not self.connect():
-            logger.error("Cannot initialize schema: database connection failed")
-            return False
-            
+
+    @property
+    def pool(self) -> ConnectionPool:
+        # Created lazily so that callers can still adjust self.config after construction
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool(dict(self.config), **self.pool_settings)
+        return self._pool
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return self.pool.stats()
+
+    def migrate_schema(self) -> bool:
+        """Apply pending migrations from backend/migrations"""
         try:
-            # Define table schemas based on CSV file headers
-            schema_definitions = {
-                'ammo': """
-                    CREATE TABLE IF NOT EXISTS ammo (
-                        id VARCHAR(20) PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        type ENUM('normal', 'HP', 'AP'),
-                        special TEXT,
-                        weight DECIMAL(4,2),
-                        avg_price INT
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                """,
-                
-                'armor': """
-                    CREATE TABLE IF NOT EXISTS armor (
-                        id VARCHAR(20) PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        physical INT,
-                        radioactive INT,
-                        chemical INT,
-                        thermal INT,
-                        electric INT,
-                        psy INT,
-                        artefact_slots INT,
-                        quick_slots INT,
-                        reliability INT,
-                        weight DECIMAL(4,2),
-                        special TEXT,
-                        avg_price INT
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                """,
-                
-                'artifacts': """
-                    CREATE TABLE IF NOT EXISTS artifacts (
-                        id VARCHAR(20) PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        property TEXT,
-                        source ENUM('gravitational anomlaies',
-                                    'thermal anomalies',
-                                    'electric anomalies',
-                                    'toxic anomalies'),
-                        rarity ENUM('common',
-                                    'uncommon',
-                                    'rare',
-                                    'legendary',
-                                    'archi-artifact'),
-                        weight DECIMAL(4,2),
-                        avg_price INT
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                """,
-                
-                'beasts': """
-                    CREATE TABLE IF NOT EXISTS beasts (
-                        id VARCHAR(20) PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        size ENUM('small', 'medium', 'large', 'humanoid'),
-                        description TEXT,
-                        abilities TEXT,
-                        HP INT,
-                        agility INT
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                """,
-                
-                'food': """
-                    CREATE TABLE IF NOT EXISTS food (
-                        id VARCHAR(50) PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        food_points INT,
-                        weight DECIMAL(4,2),
-                        avg_price INT,
-                        bonus TEXT
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                """,
-                
-                'medicine': """
-                    CREATE TABLE IF NOT EXISTS medicine (
-                        id VARCHAR(20) PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        property TEXT,
-                        weight DECIMAL(4,2),
-                        avg_price INT
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                """,
-                
-                'weapons': """
-                    CREATE TABLE IF NOT EXISTS weapons (
-                        id VARCHAR(20) PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        type VARCHAR(50),
-                        d4 INT DEFAULT 0,
-                        d6 INT DEFAULT 0,
-                        d8 INT DEFAULT 0,
-                        d10 INT DEFAULT 0,
-                        d12 INT DEFAULT 0,
-                        d20 INT DEFAULT 0,
-                        rof INT,
-                        `range` ENUM('close', 'medium', 'long'),
-                        calibre VARCHAR(50),
-                        reliability INT,
-                        weight DECIMAL(4,2),
-                        capacity INT,
-                        avg_price INT
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                """,
-                
-                'anomalies': """
-                    CREATE TABLE IF NOT EXISTS anomalies (
-                        id VARCHAR(20) PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        strength ENUM('weak',
-                                    'normal',
-                                    'strong',
-                                    'charged'),
-                        d4 INT DEFAULT 0,
-                        d6 INT DEFAULT 0,
-                        d8 INT DEFAULT 0,
-                        d10 INT DEFAULT 0,
-                        d12 INT DEFAULT 0,
-                        d20 INT DEFAULT 0,
-                        type ENUM('gravity',
-                                'electric',
-                                'thermal',
-                                'toxic',
-                                'special'),
-                        visibility ENUM('almost invisible',
-                                        'invisible',
-                                        'visible'),
-                        behavior TEXT
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
-                """
-            }
-            
-            # Create tables
-            tables_created = 0
-            for table_name, schema in schema_definitions.items():
-                try:
-                    with self.get_connection() as conn:
-                        with conn.cursor() as cursor:
-                            logger.info(f"Creating table: {table_name}")
-                            cursor.execute(schema)
-                            conn.commit()
-                            tables_created += 1
-                except Exception as e:
-                    logger.error(f"Error creating table {table_name}: {e}")
-            
-            logger.info(f"Created {tables_created} tables")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error initializing schema: {e}")
+            applied = MigrationRunner(self).run()
+        except Error as e:
+            logger.error(f"Error migrating schema: {e}")
             return False
-        finally:
-            self.close()
-        
+        if applied:
+            logger.info(f"Applied schema migrations: {applied}")
+            self.invalidate_schema()
+        return True
+
+    def _acquire(self, pool: ConnectionPool):
+        started = time.perf_counter()
+        conn = pool.acquire()
+        instrumentation.record_acquire(time.perf_counter() - started)
+        return conn
+
     @contextmanager
     def get_connection(self):
-        conn = None
+        pool = self.pool
         try:
-            if self.connection and hasattr(self.connection, 'open') and self.connection.open:
-                conn = self.connection
-            else:
-                conn = pymysql.connect(**self.config)
-            yield conn
+            conn = self._acquire(pool)
         except Error as e:
             logger.error(f"Database connection error: {e}")
             raise
+        broken = False
+        try:
+            yield conn
+        except BaseException as e:
+            if isinstance(e, Error):
+                logger.error(f"Database connection error: {e}")
+            broken = isinstance(e, (pymysql.err.OperationalError, pymysql.err.InterfaceError))
+            if not broken:
+                # Never hand a connection with a half-finished transaction back to the pool
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+            raise
         finally:
-            if conn != self.connection and conn is not None:
-                conn.close()
+            pool.release(conn, discard=broken)
 
     @contextmanager
     def get_cursor(self, dictionary=True):
@@ -232,7 +380,7 @@ class Database:
                     cursor = conn.cursor()
                 else:
                     cursor = conn.cursor(pymysql.cursors.Cursor)
-                yield cursor
+                yield instrumentation.traced(cursor)
                 conn.commit()
             except Error as e:
                 conn.rollback()
@@ -243,16 +391,13 @@ class Database:
                     cursor.close()
                     
     def connect(self) -> bool:
-        if self.connection and hasattr(self.connection, 'open') and self.connection.open:
-            return True
-            
+        """Wait until the database is reachable and warm up the connection pool"""
         max_retries = 5
         retry_count = 0
         
         while retry_count < max_retries:
             try:
-                self.connection = pymysql.connect(**self.config)
-                self.cursor = self.connection.cursor()
+                self.pool.fill()
                 logger.info("Successfully connected to database")
                 return True
             except Error as e:
@@ -265,103 +410,300 @@ class Database:
         return False
     
     def close(self) -> None:
-        if self.cursor:
-            self.cursor.close()
-            self.cursor = None
-        if self.connection:
-            self.connection.close()
-            self.connection = None
-            logger.info("Database connection closed")
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+            logger.info("Database connection pool closed")
             
     def __del__(self):
-        self.close()
+        if getattr(self, '_pool', None) is not None:
+            self.close()
     
     def execute_query(self, query: str, params: tuple = None):
         with self.get_cursor() as cursor:
             cursor.execute(query, params or ())
-            if query.strip().upper().startswith(('SELECT', 'SHOW')):
+            if query.strip().upper().startswith(('SELECT', 'SHOW', 'EXPLAIN', 'DESCRIBE')):
                 return cursor.fetchall()
-            return cursor.rowcount
+            rowcount = cursor.rowcount
+        # Writes may touch any table; counts and cached rows are refetched on next use
+        self.invalidate_table_data()
+        return rowcount
     
     def execute_many(self, query: str, params_list: List[tuple]):
         with self.get_connection() as conn:
-            with conn.cursor() as cursor:
-                cursor.executemany(query, params_list)
-                conn.commit()
+            with instrumentation.traced(conn.cursor()) as cursor:
+                try:
+                    cursor.executemany(query, params_list)
+                    conn.commit()
+                except Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    self.invalidate_table_data()
                 return cursor.rowcount
     
+    def _load_schema(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Read table and column metadata for the current database in one query"""
+        query = """
+            SELECT TABLE_NAME AS table_name,
+                   COLUMN_NAME AS column_name,
+                   DATA_TYPE AS data_type,
+                   COLUMN_TYPE AS column_type,
+                   COLUMN_KEY AS column_key,
+                   IS_NULLABLE AS is_nullable,
+                   COLUMN_DEFAULT AS column_default
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE()
+            ORDER BY TABLE_NAME, ORDINAL_POSITION
+        """
+        schema = {}
+        with self.get_cursor() as cursor:
+            cursor.execute(query)
+            for row in cursor.fetchall():
+                column_type = row['column_type']
+                if isinstance(column_type, bytes):
+                    column_type = column_type.decode('utf-8')
+                enum_values = None
+                if row['data_type'] in ('enum', 'set'):
+                    enum_values = [value.replace("''", "'") for value in re.findall(r"'((?:[^']|'')*)'", column_type)]
+                schema.setdefault(row['table_name'], {})[row['column_name']] = {
+                    'name': row['column_name'],
+                    'type': row['data_type'],
+                    'column_type': column_type,
+                    'enum_values': enum_values,
+                    'key': row['column_key'] or None,
+                    'nullable': row['is_nullable'] == 'YES',
+                    'default': row['column_default'],
+                }
+        logger.info(f"Loaded schema metadata for {len(schema)} tables")
+        return schema
+
+    def get_schema(self, refresh: bool = False) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """Return the cached schema catalog, loading it on first use"""
+        schema = self._schema
+        if schema is None or refresh:
+            with self._schema_lock:
+                if self._schema is None or refresh:
+                    self._schema = self._load_schema()
+                schema = self._schema
+        return schema
+
+    @property
+    def schema_loaded(self) -> bool:
+        return self._schema is not None
+
+    def invalidate_schema(self) -> None:
+        """Drop cached schema metadata; call after DDL or a catalog reload"""
+        with self._schema_lock:
+            self._schema = None
+
+    def has_table(self, table_name: str) -> bool:
+        return table_name in self.get_tables()
+
+    def has_column(self, table_name: str, column: str) -> bool:
+        return column in self.get_columns(table_name)
+
+    def get_columns(self, table_name: str) -> Dict[str, Dict[str, Any]]:
+        """Column metadata (type, enum values, key, nullability) keyed by column name"""
+        try:
+            return self.get_schema().get(table_name, {})
+        except Error as e:
+            logger.error(f"Error getting columns for {table_name}: {e}")
+            return {}
+
+    def get_primary_key(self, table_name: str) -> Optional[str]:
+        for name, column in self.get_columns(table_name).items():
+            if column['key'] == 'PRI':
+                return name
+        return None
+
     def get_tables(self) -> List[str]:
         try:
-            with self.get_cursor() as cursor:
-                cursor.execute("SHOW TABLES")
-                tables = [row[list(row.keys())[0]] for row in cursor.fetchall()]
-                return tables
+            return [t for t in self.get_schema() if t not in INTERNAL_TABLES]
         except Error as e:
             logger.error(f"Error getting tables: {e}")
             return []
     
     def get_column_names(self, table_name: str) -> List[str]:
-        try:
-            with self.get_cursor() as cursor:
-                cursor.execute(f"DESCRIBE {table_name}")
-                columns = [row['Field'] for row in cursor.fetchall()]
-                return columns
-        except Error as e:
-            logger.error(f"Error getting column names for {table_name}: {e}")
-            return []
+        return list(self.get_columns(table_name))
     
     def table_is_empty(self, table_name: str) -> bool:
         try:
-            with self.get_cursor() as cursor:
-                cursor.execute(f"SELECT COUNT(*) as count FROM {table_name}")
-                result = cursor.fetchone()
-                return result['count'] == 0
+            return self._cached_count(table_name) == 0
         except Error as e:
             logger.error(f"Error checking if {table_name} is empty: {e}")
             return True
+
+    def get_row_counts(self, refresh: bool = False) -> Dict[str, int]:
+        """Exact row counts for every table, fetched with a single UNION ALL query
+        and cached until the next write or CSV load"""
+        try:
+            return self._load_row_counts(refresh)
+        except Error as e:
+            logger.error(f"Error counting table rows: {e}")
+            return {}
+
+    def _load_row_counts(self, refresh: bool = False) -> Dict[str, int]:
+        with self._row_counts_lock:
+            if self._row_counts is not None and not refresh:
+                missing = [t for t in self.get_tables() if t not in self._row_counts]
+                if not missing:
+                    return dict(self._row_counts)
+                counts = dict(self._row_counts)
+            else:
+                missing = self.get_tables()
+                counts = {}
+
+            if missing:
+                query = " UNION ALL ".join(
+                    f"SELECT %s AS table_name, COUNT(*) AS count FROM `{table}`" for table in missing
+                )
+                with self.get_cursor() as cursor:
+                    cursor.execute(query, tuple(missing))
+                    for row in cursor.fetchall():
+                        counts[row['table_name']] = row['count']
+
+            self._row_counts = counts
+            return dict(counts)
+
+    def invalidate_row_counts(self, table_name: str = None) -> None:
+        with self._row_counts_lock:
+            if table_name is None or self._row_counts is None:
+                self._row_counts = None
+            else:
+                self._row_counts.pop(table_name, None)
+
+    def invalidate_table_data(self, table_name: str = None) -> None:
+        """Forget cached counts and rows after a table's contents changed"""
+        self.data_version += 1
+        self.invalidate_row_counts(table_name)
+        self.cache.invalidate(table_name)
+
+    def _cached_count(self, table_name: str) -> int:
+        counts = self._load_row_counts()
+        if table_name not in counts:
+            raise Error(f"Table '{table_name}' does not exist")
+        return counts[table_name]
     
     def load_csv_to_table(self, csv_file: str, table_name: str) -> bool:
+        return self.load_csv_file(csv_file, table_name)['ok']
+
+    def load_csv_file(self, csv_file: str, table_name: str) -> Dict[str, Any]:
+        """Bulk load one CSV file into a table and report its throughput.
+
+        Streams the file with LOAD DATA LOCAL INFILE when the server allows it,
+        otherwise falls back to multi-row INSERTs inside a single transaction.
+        """
+        report = {
+            'table': table_name,
+            'file': csv_file,
+            'ok': False,
+            'rows': 0,
+            'seconds': 0.0,
+            'rows_per_sec': 0.0,
+            'method': None,
+        }
         if not os.path.exists(csv_file):
             logger.error(f"CSV file not found: {csv_file}")
-            return False
+            return report
             
+        started = time.perf_counter()
         try:
             columns = self.get_column_names(table_name)
             
-            with open(csv_file, 'r', encoding='utf-8') as f:
-                csv_reader = csv.DictReader(f)
-                
-                csv_columns = csv_reader.fieldnames
-                valid_columns = [col for col in csv_columns if col in columns]
-                
-                if not valid_columns:
-                    logger.error(f"No matching columns found for table {table_name} in {csv_file}")
-                    return False
-                
-                rows_loaded = 0
-                for chunk in self._chunk_csv_rows(csv_reader, valid_columns, 1000):
-                    if chunk:
-                        with self.get_connection() as conn:
-                            with conn.cursor() as cursor:
-                                placeholders = ', '.join(['%s'] * len(valid_columns))
-                                columns_str = ', '.join([f"`{col}`" if col.lower() in ['range', 'key', 'order', 'group', 'by', 'select', 'where'] else col for col in valid_columns])
-                                query = f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders})"
-                                
-                                cursor.executemany(query, chunk)
-                                conn.commit()
-                                rows_loaded += len(chunk)
+            with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+                header = next(csv.reader(f), [])
+                line_ending = '\r\n' if f.newlines == '\r\n' else '\n'
             
-            logger.info(f"Successfully loaded {rows_loaded} rows from {csv_file} into {table_name}")
-            return True
+            valid_columns = [col for col in header if col in columns]
+            if not valid_columns:
+                logger.error(f"No matching columns found for table {table_name} in {csv_file}")
+                return report
+            
+            rows_loaded = None
+            if self.local_infile:
+                try:
+                    rows_loaded = self._load_data_infile(csv_file, table_name, header, columns, line_ending)
+                    report['method'] = 'load_data'
+                except Error as e:
+                    if not e.args or e.args[0] not in LOCAL_INFILE_DISABLED_ERRORS:
+                        raise
+                    # local_infile is off on the server; stop trying for the rest of this process
+                    logger.warning(f"LOAD DATA LOCAL INFILE unavailable ({e}), falling back to batched INSERTs")
+                    self.local_infile = False
+            
+            if rows_loaded is None:
+                rows_loaded = self._insert_csv_rows(csv_file, table_name, valid_columns)
+                report['method'] = 'insert'
+            
+            elapsed = time.perf_counter() - started
+            report.update({
+                'ok': True,
+                'rows': rows_loaded,
+                'seconds': round(elapsed, 4),
+                'rows_per_sec': round(rows_loaded / elapsed, 1) if elapsed > 0 else float(rows_loaded),
+            })
+            logger.info(
+                f"Successfully loaded {rows_loaded} rows from {csv_file} into {table_name} "
+                f"via {report['method']} in {elapsed:.3f}s ({report['rows_per_sec']} rows/sec)"
+            )
+            return report
             
         except Error as e:
             logger.error(f"Error loading data into {table_name}: {e}")
-            return False
+            return report
+        finally:
+            self.invalidate_table_data(table_name)
+
+    def _load_data_infile(self, csv_file: str, table_name: str, header: List[str],
+                          columns: List[str], line_ending: str) -> int:
+        # CSV columns that the table lacks are read into a throwaway user variable
+        targets = []
+        assignments = []
+        for i, col in enumerate(header):
+            if col in columns:
+                targets.append(f"@c{i}")
+                assignments.append(f"`{col}` = NULLIF(@c{i}, '')")
+            else:
+                targets.append("@skip")
+        query = (
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE `{table_name}` CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            f"LINES TERMINATED BY %s IGNORE 1 LINES "
+            f"({', '.join(targets)}) SET {', '.join(assignments)}"
+        )
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(query, (os.path.abspath(csv_file), line_ending))
+                conn.commit()
+                return cursor.rowcount
+
+    def _insert_csv_rows(self, csv_file: str, table_name: str, valid_columns: List[str]) -> int:
+        placeholders = ', '.join(['%s'] * len(valid_columns))
+        columns_str = ', '.join(f"`{col}`" for col in valid_columns)
+        query = f"INSERT INTO `{table_name}` ({columns_str}) VALUES ({placeholders})"
+        
+        rows_loaded = 0
+        # One connection and one transaction for the whole file; executemany
+        # rewrites each chunk into multi-row INSERT statements
+        with self.get_connection() as conn:
+            with conn.cursor() as cursor:
+                try:
+                    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+                        csv_reader = csv.DictReader(f)
+                        for chunk in self._chunk_csv_rows(csv_reader, valid_columns, self.load_chunk_size):
+                            cursor.executemany(query, chunk)
+                            rows_loaded += len(chunk)
+                    conn.commit()
+                except Error:
+                    conn.rollback()
+                    raise
+        return rows_loaded
     
     def _chunk_csv_rows(self, csv_reader, columns, chunk_size=1000):
         chunk = []
         for row in csv_reader:
-            values = [row.get(col, None) for col in columns]
+            values = [row.get(col) or None for col in columns]
             chunk.append(values)
             
             if len(chunk) >= chunk_size:
@@ -370,64 +712,283 @@ class Database:
         
         if chunk: 
             yield chunk
+
+    def load_csv_files(self, jobs: List[Tuple[str, str]], workers: int = None) -> List[Dict[str, Any]]:
+        """Load (csv_file, table_name) jobs and return one report per file, in job order.
+
+        Different tables load in parallel; files for the same table (the
+        anomaly types) load one after another, so they never contend for
+        that table's locks and their rows keep a stable insert order.
+        """
+        if not jobs:
+            return []
+        by_table = {}
+        for index, (csv_file, table) in enumerate(jobs):
+            by_table.setdefault(table, []).append((index, csv_file))
+        workers = max(1, min(workers or self.load_workers, len(by_table), self.pool_settings['max_size']))
+        
+        def load_table(table: str, files: List[Tuple[int, str]]) -> List[Tuple[int, Dict[str, Any]]]:
+            return [(index, self.load_csv_file(csv_file, table)) for index, csv_file in files]
+        
+        started = time.perf_counter()
+        reports = [None] * len(jobs)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="csv-load") as executor:
+            for loaded in executor.map(lambda group: load_table(*group), by_table.items()):
+                for index, report in loaded:
+                    reports[index] = report
+        elapsed = time.perf_counter() - started
+        
+        total_rows = sum(r['rows'] for r in reports)
+        logger.info(
+            f"Loaded {total_rows} rows from {len(jobs)} CSV files with {workers} workers in {elapsed:.3f}s"
+        )
+        for r in reports:
+            status = "ok" if r['ok'] else "FAILED"
+            logger.info(f"  {r['table']:<12} {os.path.basename(r['file']):<16} {r['rows']:>8} rows "
+                        f"{r['rows_per_sec']:>12} rows/sec [{status}]")
+        return reports
+
+    def _csv_files_for_table(self, table: str) -> List[str]:
+        # Anomalies are split into one file per anomaly type in a subfolder
+        if table == 'anomalies':
+            anomaly_dir = os.path.join(self.csv_directory, 'anomalies')
+            if not os.path.exists(anomaly_dir):
+                logger.warning(f"Anomalies directory not found: {anomaly_dir}")
+                return []
+            files = []
+            for atype in ['gravity', 'electric', 'thermal', 'toxic', 'special']:
+                anomaly_file = os.path.join(anomaly_dir, f"{atype}.csv")
+                if os.path.exists(anomaly_file):
+                    files.append(anomaly_file)
+                else:
+                    logger.warning(f"Anomaly file not found: {anomaly_file}")
+            return files
+        
+        csv_file = os.path.join(self.csv_directory, f"{table}.csv")
+        if not os.path.exists(csv_file):
+            logger.warning(f"CSV file not found: {csv_file}")
+            return []
+        return [csv_file]
     
-    def ensure_csv_data_loaded(self) -> None:
+    def ensure_csv_data_loaded(self) -> List[Dict[str, Any]]:
+        """Bulk load empty tables and incrementally sync the rest with their CSVs"""
         if not self.connect():
             logger.error("Cannot ensure CSV data is loaded: database connection failed")
-            return     
+            return []
         try:
             tables = self.get_tables()
             logger.info(f"Found {len(tables)} tables in database")
             
-            csv_files_loaded = 0
-            
+            jobs = []
+            populated = []
             for table in tables:
                 if self.table_is_empty(table):
-                    # Special handling for anomalies table (data in subfolders)
-                    if table == 'anomalies':
-                        anomaly_dir = os.path.join(self.csv_directory, 'anomalies')
-                        if os.path.exists(anomaly_dir):
-                            logger.info(f"Loading anomalies from directory: {anomaly_dir}")
-                            anomaly_types = ['gravity', 'electric', 'thermal', 'toxic', 'special']
-                            anomalies_loaded = 0
-                            
-                            for atype in anomaly_types:
-                                anomaly_file = os.path.join(anomaly_dir, f"{atype}.csv")
-                                if os.path.exists(anomaly_file):
-                                    logger.info(f"Loading anomaly file: {anomaly_file}")
-                                    if self.load_csv_to_table(anomaly_file, table):
-                                        csv_files_loaded += 1
-                                        anomalies_loaded += 1
-                                else:
-                                    logger.warning(f"Anomaly file not found: {anomaly_file}")
-                            
-                            logger.info(f"Loaded {anomalies_loaded} anomaly files")
-                        else:
-                            logger.warning(f"Anomalies directory not found: {anomaly_dir}")
-                    
-                    # Standard handling for all other tables
-                    else:
-                        csv_file = os.path.join(self.csv_directory, f"{table}.csv")
-                        if os.path.exists(csv_file):
-                            logger.info(f"Table {table} is empty. Loading data from {csv_file}")
-                            if self.load_csv_to_table(csv_file, table):
-                                csv_files_loaded += 1
-                        else:
-                            logger.warning(f"CSV file not found: {csv_file}")
+                    files = self._csv_files_for_table(table)
+                    if files:
+                        logger.info(f"Table {table} is empty. Loading data from {len(files)} CSV file(s)")
+                    jobs.extend((csv_file, table) for csv_file in files)
                 else:
-                    logger.info(f"Table {table} already contains data, skipping")
+                    populated.append(table)
             
+            reports = self.load_csv_files(jobs)
+            for report in reports:
+                if report['ok']:
+                    self._record_manifest(report['file'], report['table'])
+            csv_files_loaded = sum(1 for r in reports if r['ok'])
             logger.info(f"Loaded data from {csv_files_loaded} CSV files")
+            
+            # Tables that already hold data only receive the rows that changed
+            reports.extend(self.sync_catalog(populated))
+            self.invalidate_schema()
+            return reports
         
         except Exception as e:
             logger.error(f"Error ensuring CSV data is loaded: {str(e)}")
             import traceback
             logger.error(traceback.format_exc())
+            return []
+
+    def _manifest_path(self, csv_file: str) -> str:
+        return os.path.relpath(csv_file, self.csv_directory).replace(os.sep, '/')
+
+    @staticmethod
+    def _file_hash(csv_file: str) -> str:
+        digest = hashlib.sha256()
+        with open(csv_file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _read_csv_rows(self, csv_file: str, table_name: str) -> Tuple[List[str], Dict[str, List[Any]]]:
+        """Parse a CSV into {primary key: column values} using the loader's NULL rules"""
+        columns = self.get_column_names(table_name)
+        primary_key = self.get_primary_key(table_name) or 'id'
+        with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+            csv_reader = csv.DictReader(f)
+            valid_columns = [col for col in (csv_reader.fieldnames or []) if col in columns]
+            if primary_key not in valid_columns:
+                raise ValueError(f"{csv_file} has no '{primary_key}' column for table {table_name}")
+            key_index = valid_columns.index(primary_key)
+            rows = {}
+            for row in csv_reader:
+                values = [row.get(col) or None for col in valid_columns]
+                rows[values[key_index]] = values
+        return valid_columns, rows
+
+    @staticmethod
+    def _row_hash(values: List[Any]) -> str:
+        return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+    def _write_row_hashes(self, cursor, table_name: str, source_file: str,
+                          hashes: Dict[str, str], content_hash: str, row_count: int) -> None:
+        if hashes:
+            cursor.executemany(
+                """
+                INSERT INTO catalog_rows (table_name, row_id, source_file, row_hash)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE source_file = VALUES(source_file), row_hash = VALUES(row_hash)
+                """,
+                [(table_name, row_id, source_file, row_hash) for row_id, row_hash in hashes.items()]
+            )
+        cursor.execute(
+            """
+            INSERT INTO catalog_files (file_path, table_name, content_hash, row_count)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE table_name = VALUES(table_name),
+                                    content_hash = VALUES(content_hash),
+                                    row_count = VALUES(row_count)
+            """,
+            (source_file, table_name, content_hash, row_count)
+        )
+
+    def _record_manifest(self, csv_file: str, table_name: str) -> None:
+        """Store file and row hashes for a CSV that was just bulk loaded"""
+        try:
+            source_file = self._manifest_path(csv_file)
+            _, rows = self._read_csv_rows(csv_file, table_name)
+            hashes = {row_id: self._row_hash(values) for row_id, values in rows.items()}
+            with self.get_cursor() as cursor:
+                cursor.execute(
+                    "DELETE FROM catalog_rows WHERE table_name = %s AND source_file = %s",
+                    (table_name, source_file)
+                )
+                self._write_row_hashes(cursor, table_name, source_file, hashes,
+                                       self._file_hash(csv_file), len(rows))
+        except (Error, ValueError) as e:
+            logger.error(f"Error recording manifest for {csv_file}: {e}")
+
+    def sync_csv_file(self, csv_file: str, table_name: str, force: bool = False) -> Dict[str, Any]:
+        """Apply only the rows of a CSV that changed since it was last synced.
+
+        Skips the file entirely when its content hash matches the manifest;
+        otherwise diffs per-row hashes and upserts changed rows and deletes
+        rows that disappeared from the file, all in one transaction.
+        """
+        source_file = self._manifest_path(csv_file)
+        report = {
+            'table': table_name,
+            'file': csv_file,
+            'ok': False,
+            'changed': False,
+            'upserted': 0,
+            'deleted': 0,
+        }
+        try:
+            content_hash = self._file_hash(csv_file)
+            manifest = self.execute_query(
+                "SELECT content_hash FROM catalog_files WHERE file_path = %s", (source_file,)
+            )
+            if manifest and manifest[0]['content_hash'] == content_hash and not force:
+                report['ok'] = True
+                return report
+            
+            columns, rows = self._read_csv_rows(csv_file, table_name)
+            primary_key = self.get_primary_key(table_name) or 'id'
+            hashes = {row_id: self._row_hash(values) for row_id, values in rows.items()}
+            stored = {
+                row['row_id']: row['row_hash']
+                for row in self.execute_query(
+                    "SELECT row_id, row_hash FROM catalog_rows WHERE table_name = %s AND source_file = %s",
+                    (table_name, source_file)
+                )
+            }
+            changed = [row_id for row_id, row_hash in hashes.items() if stored.get(row_id) != row_hash]
+            removed = [row_id for row_id in stored if row_id not in hashes]
+            
+            columns_str = ', '.join(f"`{col}`" for col in columns)
+            placeholders = ', '.join(['%s'] * len(columns))
+            updates = ', '.join(f"`{col}` = VALUES(`{col}`)" for col in columns if col != primary_key)
+            upsert = (
+                f"INSERT INTO `{table_name}` ({columns_str}) VALUES ({placeholders}) "
+                f"ON DUPLICATE KEY UPDATE {updates or f'`{primary_key}` = `{primary_key}`'}"
+            )
+            
+            with self.get_cursor() as cursor:
+                if changed:
+                    cursor.executemany(upsert, [rows[row_id] for row_id in changed])
+                if removed:
+                    cursor.executemany(f"DELETE FROM `{table_name}` WHERE `{primary_key}` = %s", removed)
+                    cursor.executemany(
+                        "DELETE FROM catalog_rows WHERE table_name = %s AND row_id = %s",
+                        [(table_name, row_id) for row_id in removed]
+                    )
+                self._write_row_hashes(cursor, table_name, source_file,
+                                       {row_id: hashes[row_id] for row_id in changed},
+                                       content_hash, len(rows))
+            
+            report.update({
+                'ok': True,
+                'changed': bool(changed or removed),
+                'upserted': len(changed),
+                'deleted': len(removed),
+            })
+            logger.info(f"Synced {source_file} into {table_name}: "
+                        f"{len(changed)} upserted, {len(removed)} deleted")
+            return report
+        
+        except (Error, ValueError, OSError) as e:
+            logger.error(f"Error syncing {csv_file} into {table_name}: {e}")
+            return report
         finally:
-            self.close()
+            if report['changed'] or not report['ok']:
+                self.invalidate_table_data(table_name)
+
+    def sync_table(self, table_name: str, force: bool = False) -> List[Dict[str, Any]]:
+        # Files of one table run in order so a row moving between files is never deleted last
+        return [self.sync_csv_file(csv_file, table_name, force)
+                for csv_file in self._csv_files_for_table(table_name)]
+
+    def sync_catalog(self, tables: List[str] = None, force: bool = False) -> List[Dict[str, Any]]:
+        """Incrementally reload changed CSVs; tables are synced in parallel"""
+        if tables is None:
+            tables = self.get_tables()
+        if not tables:
+            return []
+        
+        workers = max(1, min(self.load_workers, len(tables), self.pool_settings['max_size']))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="csv-sync") as executor:
+            reports = [r for table_reports in executor.map(lambda t: self.sync_table(t, force), tables)
+                       for r in table_reports]
+        
+        changed = [r for r in reports if r['changed']]
+        logger.info(f"Catalog sync checked {len(reports)} CSV files, {len(changed)} changed")
+        return reports
     
+    def _fetch_table(self, table_name: str) -> Tuple[List[str], Optional[str], List[Dict[str, Any]]]:
+        """Read a whole table for the catalog cache"""
+        columns = self.get_column_names(table_name)
+        if not columns:
+            raise Error(f"Table '{table_name}' does not exist")
+        primary_key = self.get_primary_key(table_name)
+        query = f"SELECT * FROM `{table_name}`"
+        if primary_key:
+            query += f" ORDER BY `{primary_key}`"
+        return columns, primary_key, self.execute_query(query)
+
     def get_all(self, table_name: str, limit: int = 1000, offset: int = 0) -> List[Dict[str, Any]]:
         try:
+            if self.cache.is_cacheable(table_name):
+                return self.cache.get_all(table_name, limit, offset)
             query = f"SELECT * FROM {table_name} LIMIT %s OFFSET %s"
             return self.execute_query(query, (limit, offset))
         except Error as e:
@@ -436,6 +997,8 @@ class Database:
             
     def get_by_id(self, table_name: str, id_column: str, id_value: Any) -> Optional[Dict[str, Any]]:
         try:
+            if self.cache.is_cacheable(table_name):
+                return self.cache.get_by_id(table_name, id_column, id_value)
             query = f"SELECT * FROM {table_name} WHERE {id_column} = %s"
             results = self.execute_query(query, (id_value,))
             return results[0] if results else None
@@ -445,12 +1008,36 @@ class Database:
             
     def search(self, table_name: str, column: str, search_term: str, limit: int = 50) -> List[Dict[str, Any]]:
         try:
+            if self.cache.is_cacheable(table_name):
+                return self.cache.search(table_name, column, search_term, limit)
             query = f"SELECT * FROM {table_name} WHERE {column} LIKE %s LIMIT %s"
             return self.execute_query(query, (f"%{search_term}%", limit))
         except Error as e:
             logger.error(f"Error searching in {table_name}: {e}")
             return []
             
+    def fuzzy_search(self, table_name: str, column: str, search_term: str,
+                     limit: int = 50, threshold: float = 0.3) -> List[Tuple[Dict[str, Any], float]]:
+        try:
+            return self.cache.fuzzy_search(table_name, column, search_term, limit, threshold)
+        except Error as e:
+            logger.error(f"Error running fuzzy search in {table_name}: {e}")
+            return []
+            
+    def category_search(self, table_name: str, column: str, search_term: str, limit: int = 100) -> List[Dict[str, Any]]:
+        try:
+            return self.cache.category_search(table_name, column, search_term, limit)
+        except Error as e:
+            logger.error(f"Error searching in {table_name}: {e}")
+            return []
+            
+    def full_text_search(self, query: str, tables: List[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        try:
+            return self.cache.full_text_search(query, tables, limit)
+        except Error as e:
+            logger.error(f"Error running full-text search: {e}")
+            return []
+            
     def get_related(self, table_name: str, foreign_table: str, 
                    foreign_key: str, primary_key_value: Any, 
                    limit: int = 100) -> List[Dict[str, Any]]:
@@ -469,9 +1056,56 @@ class Database:
     
     def run_custom_query(self, query: str, params: tuple = None) -> Union[List[Dict[str, Any]], int]:
         return self.execute_query(query, params)
+
+    def stream_query(self, query: str, params: tuple = None, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the result of a SELECT in batches through an unbuffered cursor.
+        
+        Rows are read from the server as they are consumed, so memory stays
+        bounded by ``batch_size`` no matter how large the result is. The
+        connection is held until the generator is exhausted or closed.
+        """
+        pool = self.pool
+        conn = self._acquire(pool)
+        discard = False
+        cursor = instrumentation.traced(conn.cursor(pymysql.cursors.SSDictCursor))
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        except GeneratorExit:
+            # Closed early: draining the rest of an unbuffered result would read
+            # the whole table, so drop the connection instead
+            discard = True
+            raise
+        except Error as e:
+            logger.error(f"Error streaming query: {e}")
+            discard = True
+            raise
+        finally:
+            if not discard:
+                cursor.close()
+                # End the read's transaction so the next borrower gets a fresh snapshot
+                try:
+                    conn.rollback()
+                except Error:
+                    discard = True
+            pool.release(conn, discard=discard)
+
+    def stream_table(self, table_name: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """Stream every row of a table in primary key order"""
+        query = f"SELECT * FROM `{table_name}`"
+        primary_key = self.get_primary_key(table_name)
+        if primary_key:
+            query += f" ORDER BY `{primary_key}`"
+        return self.stream_query(query, batch_size=batch_size)
     
     def count(self, table_name: str, where_clause: str = None, params: tuple = None) -> int:
         try:
+            if not where_clause:
+                return self._cached_count(table_name)
             query = f"SELECT COUNT(*) as count FROM {table_name}"
             if where_clause:
                 query += f" WHERE {where_clause}"
@@ -484,13 +1118,24 @@ class Database:
 
 db = Database()
 
-def ensure_data_loaded():
-    if not db.get_tables():
-        logger.info("No tables found in database. Creating schema...")
-        db.initialize_schema_from_csvs()
+def ensure_data_loaded() -> bool:
+    """Create the schema if needed, load the CSVs and warm the catalog cache"""
+    if not db.connect():
+        return False
+
+    if not db.migrate_schema():
+        return False
 
     logger.info("Ensuring CSV data is loaded...")
     db.ensure_csv_data_loaded()
 
+    try:
+        db.cache.warm()
+        logger.info(f"Catalog cache warmed: {db.cache.stats()['tables']}")
+    except Error as e:
+        logger.error(f"Error warming catalog cache: {e}")
+        return False
+    return True
+
 if __name__ == "__main__":
     ensure_data_loaded()
\ No newline at end of file
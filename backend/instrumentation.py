@@ -0,0 +1,232 @@
+import re
+import time
+import logging
+import threading
+import contextvars
+from collections import deque, Counter
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# A request that runs the same query shape this many times is flagged as N+1
+REPEATED_QUERY_THRESHOLD = 5
+
+QUOTED_RE = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+SPACE_RE = re.compile(r"\s+")
+
+UNKNOWN_ROWCOUNT = 2 ** 64 - 1
+
+
+def query_shape(sql: str) -> str:
+    """Reduce a statement to its shape: literals become ?, IN lists collapse"""
+    shape = QUOTED_RE.sub("?", sql)
+    shape = NUMBER_RE.sub("?", shape)
+    shape = SPACE_RE.sub(" ", shape).strip()
+    return IN_LIST_RE.sub("(?)", shape)
+
+
+class RequestTrace:
+    """Database work done on behalf of one HTTP request.
+
+    Queries can be recorded from the event loop and from database worker
+    threads at the same time, so every update takes the trace's lock.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route = path
+        self.status = None
+        self.started = time.time()
+        self.duration = None
+        self.queries = []
+        self.acquire_seconds = 0.0
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def record_query(self, sql: str, seconds: float, rows: Optional[int]) -> None:
+        with self._lock:
+            self.queries.append((query_shape(sql), seconds, rows))
+
+    def record_acquire(self, seconds: float) -> None:
+        with self._lock:
+            self.acquire_seconds += seconds
+            self.connections += 1
+
+    @property
+    def query_count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def query_seconds(self) -> float:
+        with self._lock:
+            return sum(seconds for _, seconds, _ in self.queries)
+
+    def repeated_shapes(self, threshold: int = REPEATED_QUERY_THRESHOLD) -> Dict[str, int]:
+        with self._lock:
+            counts = Counter(shape for shape, _, _ in self.queries)
+        return {shape: n for shape, n in counts.items() if n >= threshold}
+
+    def summary(self, include_queries: bool = False) -> Dict[str, Any]:
+        with self._lock:
+            queries = list(self.queries)
+        summary = {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started": self.started,
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+            "queries": len(queries),
+            "query_ms": round(sum(q[1] for q in queries) * 1000, 2),
+            "rows": sum(q[2] or 0 for q in queries),
+            "connections": self.connections,
+            "acquire_ms": round(self.acquire_seconds * 1000, 2),
+            "repeated_queries": self.repeated_shapes(),
+        }
+        if include_queries:
+            summary["query_log"] = [
+                {"shape": shape, "ms": round(seconds * 1000, 3), "rows": rows}
+                for shape, seconds, rows in queries
+            ]
+        return summary
+
+
+_current_trace = contextvars.ContextVar("db_request_trace", default=None)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def record_query(sql: str, seconds: float, rows: Optional[int]) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record_query(sql, seconds, rows)
+
+
+def record_acquire(seconds: float) -> None:
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record_acquire(seconds)
+
+
+class TracedCursor:
+    """Cursor proxy that reports each execute() to the current request trace"""
+
+    def __init__(self, cursor, trace: RequestTrace):
+        self._cursor = cursor
+        self._trace = trace
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def _timed(self, method, query, args):
+        started = time.perf_counter()
+        try:
+            return method(query, args)
+        finally:
+            rows = self._cursor.rowcount
+            # Unbuffered cursors report -1 or 2**64 - 1 until the result is read
+            if rows is None or not 0 <= rows < UNKNOWN_ROWCOUNT:
+                rows = None
+            self._trace.record_query(query, time.perf_counter() - started, rows)
+
+    def execute(self, query, args=None):
+        return self._timed(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._timed(self._cursor.executemany, query, args)
+
+
+def traced(cursor):
+    """Wrap a cursor for the current request; outside a request it is returned as is"""
+    trace = _current_trace.get()
+    return TracedCursor(cursor, trace) if trace is not None else cursor
+
+
+class RequestLog:
+    """Recent request traces plus per-route totals for the debug endpoint"""
+
+    def __init__(self, max_traces: int = 200, max_flagged: int = 50):
+        self.recent = deque(maxlen=max_traces)
+        self.flagged = deque(maxlen=max_flagged)
+        self.routes = {}
+        self._lock = threading.Lock()
+
+    def start(self, method: str, path: str) -> contextvars.Token:
+        return _current_trace.set(RequestTrace(method, path))
+
+    def detach(self, token: contextvars.Token) -> RequestTrace:
+        """Stop tracing in the current context and return the trace unfinished.
+
+        For responses whose body is streamed after the handler returns: the
+        trace keeps collecting the body's queries until ``record`` is called.
+        """
+        trace = _current_trace.get()
+        _current_trace.reset(token)
+        return trace
+
+    def finish(self, token: contextvars.Token, route: str = None, status: int = None) -> RequestTrace:
+        return self.record(self.detach(token), route, status)
+
+    def record(self, trace: RequestTrace, route: str = None, status: int = None) -> RequestTrace:
+        trace.duration = time.time() - trace.started
+        trace.route = route or trace.path
+        trace.status = status
+
+        repeated = trace.repeated_shapes()
+        if repeated:
+            logger.warning(f"Repeated queries in {trace.method} {trace.route}: {repeated}")
+
+        key = f"{trace.method} {trace.route}"
+        with self._lock:
+            self.recent.append(trace)
+            if repeated:
+                self.flagged.append(trace)
+            totals = self.routes.setdefault(key, {
+                "requests": 0, "queries": 0, "query_ms": 0.0, "acquire_ms": 0.0, "max_queries": 0, "flagged": 0
+            })
+            totals["requests"] += 1
+            totals["queries"] += trace.query_count
+            totals["query_ms"] += trace.query_seconds * 1000
+            totals["acquire_ms"] += trace.acquire_seconds * 1000
+            totals["max_queries"] = max(totals["max_queries"], trace.query_count)
+            totals["flagged"] += 1 if repeated else 0
+        return trace
+
+    def report(self, limit: int = 50) -> Dict[str, Any]:
+        with self._lock:
+            recent = list(self.recent)[-limit:]
+            flagged = list(self.flagged)
+            routes = {key: dict(totals) for key, totals in self.routes.items()}
+
+        for totals in routes.values():
+            totals["avg_queries"] = round(totals["queries"] / totals["requests"], 2)
+            totals["query_ms"] = round(totals["query_ms"], 2)
+            totals["acquire_ms"] = round(totals["acquire_ms"], 2)
+        return {
+            "routes": routes,
+            "recent": [trace.summary() for trace in reversed(recent)],
+            "repeated_queries": [trace.summary(include_queries=True) for trace in reversed(flagged)],
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.recent.clear()
+            self.flagged.clear()
+            self.routes.clear()
+
+
+request_log = RequestLog()
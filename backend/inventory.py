@@ -0,0 +1,222 @@
+from typing import Dict, Any, Optional, Iterable, Iterator, List, Union
+
+
+def item_grams(item: Dict[str, Any]) -> int:
+    """Weight of an item stack in whole grams, so running totals stay exact"""
+    return round((item.get("weight") or 0) * (item.get("quantity") or 0) * 1000)
+
+
+class LoadTotals:
+    """Running weight and units-by-type of a set of items"""
+
+    def __init__(self):
+        self.grams = 0
+        self.units = {}
+
+    def add(self, item: Dict[str, Any], sign: int = 1) -> None:
+        self.grams += sign * item_grams(item)
+        item_type = item.get("type")
+        units = self.units.get(item_type, 0) + sign * (item.get("quantity") or 0)
+        if units:
+            self.units[item_type] = units
+        else:
+            self.units.pop(item_type, None)
+
+    def remove(self, item: Dict[str, Any]) -> None:
+        self.add(item, -1)
+
+
+class Inventory:
+    """A character's carried items: item id -> item, in the order added.
+
+    Lookup, add, replace and remove are O(1) and iteration keeps insertion
+    order, so an inventory behaves like the list it replaces without the
+    scans. Ids come from ``next_id``, which only grows, so an id is never
+    handed out twice even after the newest item is removed. ``totals``
+    follows every change; change quantities through ``set_quantity``.
+
+    Saved with the rest of the character as ``{"next_id": ..., "items": [...]}``
+    through ``to_json``; ``from_json`` also accepts the older plain list.
+    After ``track_changes`` every change is also recorded, so a saved copy
+    can be brought up to date with ``drain_changes``/``apply_changes``
+    instead of saving the whole inventory again.
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]] = (), next_id: int = 1):
+        self._items = {}
+        self._changes = None
+        self.totals = LoadTotals()
+        unnumbered = []
+        for item in items:
+            # Items without an id, or reusing one, get a fresh id below
+            if item.get("id") is None or item["id"] in self._items:
+                unnumbered.append(item)
+            else:
+                self._items[item["id"]] = item
+                self.totals.add(item)
+        self.next_id = max(next_id, max(self._items, default=0) + 1)
+        for item in unnumbered:
+            self.put(item)
+
+    @classmethod
+    def from_json(cls, value: Union[None, List[Dict[str, Any]], Dict[str, Any]]) -> "Inventory":
+        if value is None:
+            return cls()
+        if isinstance(value, list):
+            return cls(value)
+        return cls(value.get("items", ()), value.get("next_id", 1))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {"next_id": self.next_id, "items": self.to_list()}
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return list(self._items.values())
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._items.values())
+
+    def __contains__(self, item_id: object) -> bool:
+        return item_id in self._items
+
+    def __repr__(self) -> str:
+        return f"Inventory({len(self._items)} items, next_id={self.next_id})"
+
+    def get(self, item_id: int) -> Optional[Dict[str, Any]]:
+        return self._items.get(item_id)
+
+    def copy(self) -> "Inventory":
+        """An independent copy, items included, with the same id counter"""
+        return Inventory([dict(item) for item in self], self.next_id)
+
+    def track_changes(self) -> None:
+        """Start recording changes for ``drain_changes``"""
+        self._changes = []
+
+    def drain_changes(self) -> Optional[List[list]]:
+        """Changes since the last call, or None if changes are not being recorded"""
+        changes = self._changes
+        if changes is not None:
+            self._changes = []
+        return changes
+
+    def apply_changes(self, changes: Iterable[list]) -> None:
+        """Replay changes taken from another inventory with ``drain_changes``"""
+        for change in changes:
+            if change[0] == "set":
+                self._store(dict(change[1]))
+            else:
+                self.remove(change[1])
+
+    def _store(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        # New ids go at the end, existing ones keep their place
+        previous = self._items.get(item["id"])
+        if previous is not None:
+            self.totals.remove(previous)
+        self._items[item["id"]] = item
+        self.totals.add(item)
+        self.next_id = max(self.next_id, item["id"] + 1)
+        if self._changes is not None:
+            self._changes.append(["set", dict(item)])
+        return item
+
+    def add(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a new item under the next id and return it"""
+        return self._store({"id": self.next_id, **fields})
+
+    def put(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Store an existing item (e.g. one taken off) at the end, keeping its id if free"""
+        if item.get("id") is None or item["id"] in self._items:
+            item["id"] = self.next_id
+        return self._store(item)
+
+    def replace(self, item_id: int, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Swap in a new version of an item, keeping its place in the order"""
+        if item_id not in self._items:
+            raise KeyError(item_id)
+        return self._store({"id": item_id, **item})
+
+    def set_quantity(self, item_id: int, quantity: int) -> Dict[str, Any]:
+        """Change the size of a stack in place"""
+        item = self._items[item_id]
+        self.totals.remove(item)
+        item["quantity"] = quantity
+        item["total_weight"] = item["weight"] * quantity
+        self.totals.add(item)
+        if self._changes is not None:
+            self._changes.append(["set", dict(item)])
+        return item
+
+    def remove(self, item_id: int) -> Optional[Dict[str, Any]]:
+        """Take an item out and return it, or None if there is no such id"""
+        item = self._items.pop(item_id, None)
+        if item is not None:
+            self.totals.remove(item)
+            if self._changes is not None:
+                self._changes.append(["remove", item_id])
+        return item
+
+
+class Equipment(dict):
+    """Equipment slots (slot -> item or None) with running totals of what is worn.
+
+    Still a plain dict to JSON and the API. Assigning a slot keeps
+    ``totals`` in step, so slots must only be changed by item assignment.
+    Changes are recorded like ``Inventory`` changes once ``track_changes``
+    has been called.
+    """
+
+    def __init__(self, slots: Optional[Dict[str, Optional[Dict[str, Any]]]] = None):
+        super().__init__(slots or {})
+        self._changes = None
+        self.totals = LoadTotals()
+        for item in self.values():
+            if item:
+                self.totals.add(item)
+
+    def copy(self) -> "Equipment":
+        return Equipment({slot: dict(item) if item else None for slot, item in self.items()})
+
+    def track_changes(self) -> None:
+        self._changes = []
+
+    def drain_changes(self) -> Optional[List[list]]:
+        changes = self._changes
+        if changes is not None:
+            self._changes = []
+        return changes
+
+    def apply_changes(self, changes: Iterable[list]) -> None:
+        for slot, item in changes:
+            self[slot] = dict(item) if item else None
+
+    def __setitem__(self, slot: str, item: Optional[Dict[str, Any]]) -> None:
+        previous = self.get(slot)
+        if previous:
+            self.totals.remove(previous)
+        super().__setitem__(slot, item)
+        if item:
+            self.totals.add(item)
+        if self._changes is not None:
+            self._changes.append([slot, dict(item) if item else None])
+
+
+def encumbrance(inventory: Inventory, equipment: Equipment, capacity: float) -> Dict[str, Any]:
+    """How loaded a character is, read from the running totals"""
+    carried = inventory.totals.grams / 1000
+    equipped = equipment.totals.grams / 1000
+    units = dict(inventory.totals.units)
+    for item_type, count in equipment.totals.units.items():
+        units[item_type] = units.get(item_type, 0) + count
+    total = (inventory.totals.grams + equipment.totals.grams) / 1000
+    return {
+        "carried_weight": carried,
+        "equipped_weight": equipped,
+        "total_weight": total,
+        "capacity": capacity,
+        "remaining_capacity": round(capacity - total, 3),
+        "over_capacity": total > capacity,
+        "items_by_type": units,
+    }
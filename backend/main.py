@@ -1,10 +1,10 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from fastapi.staticfiles import StaticFiles  
-from fastapi.responses import FileResponse, JSONResponse
-from typing import List, Optional, Dict
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response
+from typing import List, Optional, Dict, Literal
 import random
 import string
 import uuid
@@ -12,20 +12,69 @@ from datetime import datetime, timedelta
 import jwt as pyjwt
 import os
 from passlib.context import CryptContext
-from database import db, ensure_data_loaded
+from database import db
+from startup import Warmup, catalog_warmup
+from contextlib import asynccontextmanager
+from async_database import async_db
+from query_engine import query_engine, QueryRejected, QueryTimeout
+from instrumentation import request_log
+from stores import IndexedStore
+from inventory import Inventory, Equipment, encumbrance
+from token_cache import VerifiedTokenCache
+from passwords import PasswordHasher, HasherBusy
+from persistence import state_backend
+import metrics
+import time
 from fastapi import Query, Path
 from typing import Optional, Any, Dict
 from PIL import Image
 import io
 import copy
 import os
+import json
+import base64
+import binascii
+import csv
+from decimal import Decimal, InvalidOperation
 
 
 public_path = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "public"))
 
 
+def recover_state() -> bool:
+    state_backend.recover()
+    state_backend.start()
+    return True
+
+# Game state (local snapshot and log, or the shared tables) is restored in the
+# background; a failed attempt leaves the stores untouched and is retried
+state_warmup = Warmup("state", recover_state)
+
+async def require_state_ready():
+    """Fail fast with 503 while the game state is still being restored"""
+    if not state_warmup.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Game state is being restored, try again shortly",
+            headers={"Retry-After": "2"}
+        )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # State recovery, schema setup and CSV loading run in the background so the
+    # port binds at once
+    state_warmup.start()
+    catalog_warmup.start()
+    yield
+    catalog_warmup.stop()
+    state_warmup.stop()
+    await async_db.run(state_backend.stop)
+    password_hasher.shutdown()
+    async_db.shutdown()
+    db.close()
+
 # Initialize FastAPI
-app = FastAPI(title="S.T.A.L.K.E.R. TTRPG API")
+app = FastAPI(title="S.T.A.L.K.E.R. TTRPG API", lifespan=lifespan)
 db.config['host'] = "database"
 db.config['port'] = 3306
 db.config['user'] = "ttrpg_user"
@@ -33,7 +82,37 @@ db.config['database'] = "TTRPG_DB"
 db.config['password'] ="88888888"
 # db.config['password'] = os.environ.get("MYSQL_ROOT_PASSWORD", "rootpass")
 # db.config['use_pure'] = True
-ensure_data_loaded()
+
+# Routes that read or change the game state (users, games, characters, ...),
+# including the wiki and debug routes that look up the signed-in user
+GAME_STATE_PATHS = ("/token", "/register", "/games", "/characters", "/inventory",
+                    "/wiki/query", "/wiki/reload", "/debug")
+
+def uses_game_state(request: Request) -> bool:
+    path = request.url.path
+    return request.method != "OPTIONS" and any(
+        path == prefix or path.startswith(prefix + "/") for prefix in GAME_STATE_PATHS)
+
+# With several workers, pick up other workers' changes first and save this
+# request's changes as one unit; a concurrent edit of the same record is a 409.
+# Defined before CORS so CORS wraps it and the 409 carries CORS headers; the
+# wiki, probes, metrics and static files never touch the shared state. Until
+# the shared state is loaded the routes answer 503 (require_state_ready).
+@app.middleware("http")
+async def sync_shared_state(request: Request, call_next):
+    if not state_backend.shared or not uses_game_state(request) or not state_warmup.ready:
+        return await call_next(request)
+    
+    await state_backend.refresh()
+    changes = state_backend.track_changes()
+    try:
+        response = await call_next(request)
+    finally:
+        committed = await state_backend.commit(changes)
+    if not committed:
+        return JSONResponse(status_code=status.HTTP_409_CONFLICT,
+                            content={"detail": "This was changed at the same time by someone else, please retry"})
+    return response
 
 # Configure CORS
 app.add_middleware(
@@ -44,12 +123,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def finish_request_metrics(request: Request, started: float, status_code: int) -> None:
+    elapsed = time.perf_counter() - started
+    method = request.method
+    metrics.http_requests_in_progress.dec(method=method)
+    # Label by route template so ids in the path do not create new series
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    metrics.http_requests_total.inc(method=method, route=route, status=status_code)
+    metrics.http_request_duration_seconds.observe(elapsed, method=method, route=route)
+
+async def record_metrics_when_sent(body, request: Request, started: float, status_code: int):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        finish_request_metrics(request, started, status_code)
+
+# Request counts, latency and in-flight requests for /metrics
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    metrics.http_requests_in_progress.inc(method=request.method)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish_request_metrics(request, started, 500)
+        raise
+    if "content-length" not in response.headers:
+        # A streamed body (exports, custom queries) is still being produced
+        # after the headers are sent: time the request until its last chunk
+        response.body_iterator = record_metrics_when_sent(
+            response.body_iterator, request, started, response.status_code)
+        return response
+    finish_request_metrics(request, started, response.status_code)
+    return response
+
+async def record_trace_when_sent(body, trace, route: Optional[str], status_code: int):
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        request_log.record(trace, route, status_code)
+
+# Per-request database instrumentation
+@app.middleware("http")
+async def trace_database_usage(request: Request, call_next):
+    token = request_log.start(request.method, request.url.path)
+    response = None
+    try:
+        response = await call_next(request)
+    except BaseException:
+        request_log.finish(token, getattr(request.scope.get("route"), "path", None), 500)
+        raise
+    
+    # Routing fills in the matched route, so requests group by template
+    route = getattr(request.scope.get("route"), "path", None)
+    if "content-length" not in response.headers:
+        # A streamed body (exports, custom queries) runs its queries while it
+        # is sent, after the headers are gone: record the totals at the end
+        trace = request_log.detach(token)
+        response.body_iterator = record_trace_when_sent(response.body_iterator, trace, route, response.status_code)
+        return response
+    trace = request_log.finish(token, route, response.status_code)
+    
+    response.headers["X-DB-Queries"] = str(trace.query_count)
+    response.headers["X-DB-Time-Ms"] = f"{trace.query_seconds * 1000:.2f}"
+    response.headers["X-DB-Acquire-Ms"] = f"{trace.acquire_seconds * 1000:.2f}"
+    repeated = trace.repeated_shapes()
+    if repeated:
+        response.headers["X-DB-Repeated-Queries"] = str(max(repeated.values()))
+    return response
+
 # Security
 SECRET_KEY = "YOUR_SECRET_KEY"  # In production, use a secure key and store it in env variables
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 1 day
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on its own small pool so login bursts do not block the event loop
+password_hasher = PasswordHasher(pwd_context)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 # --- DATA MODELS ---
@@ -94,6 +246,22 @@ class InventoryItem(InventoryItemBase):
 class InventoryCreate(InventoryItemBase):
     pass
 
+# Upper bound on operations in one POST /inventory/batch request
+MAX_BATCH_OPERATIONS = 500
+
+class InventoryOperation(BaseModel):
+    op: Literal["add", "update", "remove", "equip", "money"]
+    character_id: str
+    item_id: Optional[int] = None
+    item: Optional[InventoryCreate] = None
+    # How many to take off a stack for "remove"; a negative count would add items
+    quantity: int = Field(1, ge=1)
+    slot_type: Optional[str] = None
+    amount: int = 0
+
+class InventoryBatch(BaseModel):
+    operations: List[InventoryOperation]
+
 class EquipmentSlot(BaseModel):
     slot_type: str
     item_id: Optional[int] = None
@@ -205,20 +373,61 @@ class MonsterPinCreate(BaseModel):
     position_x: float = 500
     position_y: float = 500
 
-users_db = {}
-games_db = {}
-characters_db = {}
-quests_db = {}
-notes_db = {}   
-pins_db = {}
+# Users by email and games by join code are indexed for the auth and join paths
+users_db = IndexedStore("users", unique=("email",))
+games_db = IndexedStore("games", unique=("game_code",))
+# Cached tokens carry a copy of the user, so drop them when the user changes
+token_cache = VerifiedTokenCache()
+users_db.subscribe(lambda user_id, user: token_cache.invalidate_user(user_id))
+
+characters_db = IndexedStore("characters", multi=("user_id", "game_id"))
+quests_db = IndexedStore("quests")
+notes_db = IndexedStore("notes")
+pins_db = IndexedStore("pins")
+
+def load_character(character: dict) -> dict:
+    """Rebuild a saved character's Inventory and Equipment from their JSON form"""
+    if "inventory" in character:
+        character["inventory"] = Inventory.from_json(character["inventory"])
+    if "equipment" in character:
+        character["equipment"] = Equipment(character["equipment"])
+    return character
+
+# Every change is saved by the state backend (see persistence.py); handlers
+# that change a record in place must call store.touch(key) so it is seen
+for store in (users_db, games_db, quests_db, notes_db, pins_db):
+    state_backend.register(store.name, store)
+state_backend.register(characters_db.name, characters_db, decode=load_character)
+
+metrics.registry.callback_gauge(
+    "app_store_entries", "Entries in each in-memory store", ("store",),
+    lambda: {
+        ("users",): len(users_db),
+        ("games",): len(games_db),
+        ("characters",): len(characters_db),
+        ("quests",): len(quests_db),
+        ("notes",): len(notes_db),
+        ("pins",): len(pins_db),
+    })
+metrics.registry.callback_gauge(
+    "db_pool_connections", "Database pool connections by state", ("state",),
+    lambda: {(state,): db.pool_stats()[state] for state in ("idle", "in_use")})
 
 # --- HELPER FUNCTIONS ---
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Too many logins in progress, try again shortly",
+                            headers={"Retry-After": "1"})
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password)
+    except HasherBusy:
+        raise HTTPException(status_code=503, detail="Too many registrations in progress, try again shortly",
+                            headers={"Retry-After": "1"})
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -230,6 +439,56 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
 def generate_game_code(length=6):
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
 
+def allocate_game_code(length=6):
+    """Generate a join code that no existing game uses"""
+    game_code = generate_game_code(length)
+    while games_db.has_value("game_code", game_code):
+        game_code = generate_game_code(length)
+    return game_code
+
+def resolve_token_user(token: str) -> Optional[dict]:
+    """Verify a bearer token and return its user, or None if the user is gone.
+    
+    Verified tokens are cached until they expire, so repeated requests with
+    the same token skip signature verification and the user lookup.
+    """
+    user = token_cache.get(token)
+    if user is None:
+        payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        email: str = payload.get("sub")
+        if email is None:
+            return None
+        token_data = TokenData(email=email)
+        user = find_user_by_email(token_data.email)
+        if user is None:
+            return None
+        token_cache.put(token, user, payload.get("exp"))
+    # Handlers get their own copy so they cannot alter the cached user
+    return dict(user)
+
+def delete_game_cascade(game_id: str) -> None:
+    """Remove a game and everything that belongs to it"""
+    for char_id in characters_db.find("game_id", game_id):
+        del characters_db[char_id]
+        quests_db.pop(char_id, None)
+        notes_db.pop(char_id, None)
+    pins_db.pop(game_id, None)
+    del games_db[game_id]
+
+def character_view(character_id: str, character: dict) -> dict:
+    """A character as returned by the API, with its inventory as a list"""
+    view = {"id": character_id, **character}
+    if "inventory" in character:
+        view["inventory"] = character["inventory"].to_list()
+    return view
+
+def find_user_by_email(email: str) -> Optional[dict]:
+    match = users_db.get_by("email", email)
+    if match is None:
+        return None
+    user_id, user_data = match
+    return {"id": user_id, **user_data}
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -237,19 +496,13 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = TokenData(email=email)
+        user = resolve_token_user(token)
     except pyjwt.PyJWTError:
         raise credentials_exception
     
-    for user_id, user_data in users_db.items():
-        if user_data["email"] == token_data.email:
-            return {"id": user_id, **user_data}
-    
-    raise credentials_exception
+    if user is None:
+        raise credentials_exception
+    return user
 
 @app.get("/api/placeholder/{width}/{height}")
 async def get_placeholder_image(width: int, height: int):
@@ -330,7 +583,7 @@ async def get_placeholder_image(width: int, height: int):
         return Response(content=img_byte_arr.getvalue(), media_type="image/png")
 
 # --- QUEST LOG ENDPOINTS ---
-@app.get("/characters/{character_id}/quests", response_model=List[Quest])
+@app.get("/characters/{character_id}/quests", response_model=List[Quest], dependencies=[Depends(require_state_ready)])
 async def get_quests(
     character_id: str,
     current_user: dict = Depends(get_current_user)
@@ -350,7 +603,7 @@ async def get_quests(
     # Return quests or empty list if none exist
     return quests_db.get(character_id, [])
 
-@app.post("/characters/{character_id}/quests", response_model=Quest)
+@app.post("/characters/{character_id}/quests", response_model=Quest, dependencies=[Depends(require_state_ready)])
 async def create_quest(
     character_id: str,
     quest: QuestCreate,
@@ -385,10 +638,11 @@ async def create_quest(
     
     # Add to quests
     quests_db[character_id].append(new_quest)
+    quests_db.touch(character_id)
     
     return new_quest
 
-@app.put("/characters/{character_id}/quests/{quest_id}", response_model=Quest)
+@app.put("/characters/{character_id}/quests/{quest_id}", response_model=Quest, dependencies=[Depends(require_state_ready)])
 async def update_quest(
     character_id: str,
     quest_id: int,
@@ -419,11 +673,12 @@ async def update_quest(
                 **quest.dict()
             }
             quests_db[character_id][i] = updated_quest
+            quests_db.touch(character_id)
             return updated_quest
     
     raise HTTPException(status_code=404, detail="Quest not found")
 
-@app.patch("/characters/{character_id}/quests/{quest_id}/toggle", response_model=Quest)
+@app.patch("/characters/{character_id}/quests/{quest_id}/toggle", response_model=Quest, dependencies=[Depends(require_state_ready)])
 async def toggle_quest_status(
     character_id: str,
     quest_id: int,
@@ -449,11 +704,12 @@ async def toggle_quest_status(
     for i, q in enumerate(quests_db[character_id]):
         if q["id"] == quest_id:
             quests_db[character_id][i]["completed"] = not quests_db[character_id][i]["completed"]
+            quests_db.touch(character_id)
             return quests_db[character_id][i]
     
     raise HTTPException(status_code=404, detail="Quest not found")
 
-@app.delete("/characters/{character_id}/quests/{quest_id}")
+@app.delete("/characters/{character_id}/quests/{quest_id}", dependencies=[Depends(require_state_ready)])
 async def delete_quest(
     character_id: str,
     quest_id: int,
@@ -479,6 +735,7 @@ async def delete_quest(
     for i, q in enumerate(quests_db[character_id]):
         if q["id"] == quest_id:
             quests_db[character_id].pop(i)
+            quests_db.touch(character_id)
             return {"message": "Quest deleted successfully"}
     
     raise HTTPException(status_code=404, detail="Quest not found")
@@ -486,7 +743,7 @@ async def delete_quest(
 
 # --- NOTES ENDPOINTS ---
 
-@app.get("/characters/{character_id}/notes", response_model=List[Note])
+@app.get("/characters/{character_id}/notes", response_model=List[Note], dependencies=[Depends(require_state_ready)])
 async def get_notes(
     character_id: str,
     current_user: dict = Depends(get_current_user)
@@ -506,7 +763,7 @@ async def get_notes(
     # Return notes or empty list if none exist
     return notes_db.get(character_id, [])
 
-@app.post("/characters/{character_id}/notes", response_model=Note)
+@app.post("/characters/{character_id}/notes", response_model=Note, dependencies=[Depends(require_state_ready)])
 async def create_note(
     character_id: str,
     note: NoteCreate,
@@ -541,10 +798,11 @@ async def create_note(
     
     # Add to notes
     notes_db[character_id].append(new_note)
+    notes_db.touch(character_id)
     
     return new_note
 
-@app.put("/characters/{character_id}/notes/{note_id}", response_model=Note)
+@app.put("/characters/{character_id}/notes/{note_id}", response_model=Note, dependencies=[Depends(require_state_ready)])
 async def update_note(
     character_id: str,
     note_id: int,
@@ -575,11 +833,12 @@ async def update_note(
                 **note.dict()
             }
             notes_db[character_id][i] = updated_note
+            notes_db.touch(character_id)
             return updated_note
     
     raise HTTPException(status_code=404, detail="Note not found")
 
-@app.delete("/characters/{character_id}/notes/{note_id}")
+@app.delete("/characters/{character_id}/notes/{note_id}", dependencies=[Depends(require_state_ready)])
 async def delete_note(
     character_id: str,
     note_id: int,
@@ -605,6 +864,7 @@ async def delete_note(
     for i, n in enumerate(notes_db[character_id]):
         if n["id"] == note_id:
             notes_db[character_id].pop(i)
+            notes_db.touch(character_id)
             return {"message": "Note deleted successfully"}
     
     raise HTTPException(status_code=404, detail="Note not found")
@@ -612,53 +872,141 @@ async def delete_note(
 
 # --- WIKI/DATABASE ACCESS ENDPOINTS ---
 
-@app.get("/wiki/tables")
+# --- HEALTH ENDPOINTS ---
+
+@app.get("/healthz", include_in_schema=False)
+async def liveness():
+    """Liveness probe: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz", include_in_schema=False)
+async def readiness():
+    """Readiness probe: the catalog and the game state are loaded and every route can be served."""
+    ready = catalog_warmup.ready and state_warmup.ready
+    return JSONResponse(status_code=200 if ready else 503, content={
+        **catalog_warmup.status(),
+        "state": state_warmup.status()
+    })
+
+async def require_catalog_ready():
+    """Fail fast with 503 while the catalog is still loading"""
+    if not catalog_warmup.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="Catalog is warming up, try again shortly",
+            headers={"Retry-After": "2"}
+        )
+
+@app.get("/wiki/tables", dependencies=[Depends(require_catalog_ready)])
 async def get_all_tables():
     """Get a list of all available tables in the database with their row counts."""
-    tables = db.get_tables()
-    result = {}
-    
-    for table in tables:
-        count = db.count(table)
-        result[table] = count
-        
-    return {"tables": result}
+    return {"tables": await async_db.get_row_counts()}
+
+def encode_page_cursor(sort_by: Optional[str], sort_desc: bool, sort_value: Any, key_value: Any) -> str:
+    """Pack the position after the last returned row into an opaque token"""
+    payload = {"s": sort_by, "d": sort_desc, "v": sort_value, "k": key_value}
+    raw = json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
-@app.get("/wiki/tables/{table_name}")
+def decode_page_cursor(cursor: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, dict) or not {"s", "d", "v", "k"} <= payload.keys():
+            raise ValueError("incomplete cursor")
+        return payload
+    except (ValueError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+@app.get("/wiki/tables/{table_name}", dependencies=[Depends(require_catalog_ready)])
 async def get_table_data(
     table_name: str = Path(..., description="Name of the table to query"),
-    limit: int = Query(50, description="Maximum number of records to return"),
-    offset: int = Query(0, description="Number of records to skip"),
+    limit: int = Query(50, ge=1, description="Maximum number of records to return"),
+    offset: int = Query(0, ge=0, description="Number of records to skip"),
     sort_by: Optional[str] = Query(None, description="Column to sort by"),
-    sort_desc: bool = Query(False, description="Sort in descending order")
+    sort_desc: bool = Query(False, description="Sort in descending order"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page; replaces offset")
 ):
-    """Get data from a specific table with pagination and sorting."""
+    """Get data from a specific table with pagination and sorting.
+    
+    Every page returns a next_cursor. Passing it back pages by key
+    (sort column, then primary key) instead of OFFSET, so deep pages cost the
+    same as the first one and do not shift while data is reloaded.
+    """
     # Verify table exists
-    tables = db.get_tables()
-    if table_name not in tables:
+    if not await async_db.has_table(table_name):
         raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
     
     # Build query based on parameters
-    query = f"SELECT * FROM {table_name}"
+    query = f"SELECT * FROM `{table_name}`"
+    params = []
+    primary_key = db.get_primary_key(table_name)
+    direction = "DESC" if sort_desc else "ASC"
     
     # Add sorting if requested
     if sort_by:
         # Verify the column exists
-        columns = db.get_column_names(table_name)
-        if sort_by not in columns:
+        if not await async_db.has_column(table_name, sort_by):
             raise HTTPException(status_code=400, detail=f"Column '{sort_by}' not found in table '{table_name}'")
-        
-        direction = "DESC" if sort_desc else "ASC"
-        query += f" ORDER BY {sort_by} {direction}"
     
-    # Add pagination
-    query += f" LIMIT {limit} OFFSET {offset}"
+    # Continue after the last row of the previous page
+    if cursor:
+        if not primary_key:
+            raise HTTPException(status_code=400, detail=f"Table '{table_name}' does not support cursor pagination")
+        position = decode_page_cursor(cursor)
+        if position["s"] != sort_by or position["d"] != sort_desc:
+            raise HTTPException(status_code=400, detail="Cursor does not match sort_by/sort_desc")
+        
+        after = ">" if not sort_desc else "<"
+        if not sort_by:
+            query += f" WHERE `{primary_key}` {after} %s"
+            params = [position["k"]]
+        elif position["v"] is None:
+            # NULLs sort first ascending and last descending
+            if sort_desc:
+                query += f" WHERE `{sort_by}` IS NULL AND `{primary_key}` < %s"
+            else:
+                query += f" WHERE (`{sort_by}` IS NULL AND `{primary_key}` > %s) OR `{sort_by}` IS NOT NULL"
+            params = [position["k"]]
+        else:
+            # Compare with the column's own type so MySQL can range-scan the index
+            sort_value = position["v"]
+            column_type = db.get_columns(table_name)[sort_by]["type"]
+            try:
+                if column_type == "decimal":
+                    sort_value = Decimal(str(sort_value))
+                elif column_type in ("tinyint", "smallint", "mediumint", "int", "bigint"):
+                    sort_value = int(sort_value)
+            except (InvalidOperation, ValueError, TypeError):
+                raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+            query += f" WHERE (`{sort_by}` {after} %s OR (`{sort_by}` = %s AND `{primary_key}` {after} %s)"
+            query += f" OR `{sort_by}` IS NULL)" if sort_desc else ")"
+            params = [sort_value, sort_value, position["k"]]
+        offset = 0
+    
+    order = [f"`{sort_by}` {direction}"] if sort_by else []
+    if primary_key:
+        order.append(f"`{primary_key}` {direction}")
+    if order:
+        query += " ORDER BY " + ", ".join(order)
+    
+    # Add pagination; one extra row tells whether another page exists
+    query += f" LIMIT {limit + 1}"
+    if offset:
+        query += f" OFFSET {offset}"
     
     # Execute query
-    data = db.run_custom_query(query)
+    rows = await async_db.run_custom_query(query, tuple(params))
+    data = rows[:limit]
+    has_more = len(rows) > limit
+    
+    next_cursor = None
+    if has_more and primary_key:
+        last = data[-1]
+        next_cursor = encode_page_cursor(sort_by, sort_desc, last.get(sort_by) if sort_by else None, last[primary_key])
     
     # Get total count for pagination info
-    total_count = db.count(table_name)
+    total_count = await async_db.count(table_name)
     
     return {
         "table": table_name,
@@ -667,11 +1015,12 @@ async def get_table_data(
             "total": total_count,
             "limit": limit,
             "offset": offset,
-            "has_more": offset + len(data) < total_count
+            "has_more": has_more,
+            "next_cursor": next_cursor
         }
     }
 
-@app.get("/wiki/tables/{table_name}/{record_id}")
+@app.get("/wiki/tables/{table_name}/{record_id}", dependencies=[Depends(require_catalog_ready)])
 async def get_record_by_id(
     table_name: str = Path(..., description="Name of the table to query"),
     record_id: Any = Path(..., description="ID of the record to retrieve"),
@@ -679,52 +1028,194 @@ async def get_record_by_id(
 ):
     """Get a specific record from a table by ID."""
     # Verify table exists
-    tables = db.get_tables()
-    if table_name not in tables:
+    if not await async_db.has_table(table_name):
         raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
     
     # Verify column exists
-    columns = db.get_column_names(table_name)
-    if id_column not in columns:
+    if not await async_db.has_column(table_name, id_column):
         raise HTTPException(status_code=400, detail=f"Column '{id_column}' not found in table '{table_name}'")
     
     # Get record
-    record = db.get_by_id(table_name, id_column, record_id)
+    record = await async_db.get_by_id(table_name, id_column, record_id)
     if not record:
         raise HTTPException(status_code=404, detail=f"Record with {id_column}={record_id} not found in {table_name}")
     
     return record
 
-@app.get("/wiki/search/{table_name}")
+@app.get("/wiki/search/{table_name}", dependencies=[Depends(require_catalog_ready)])
 async def search_table(
     table_name: str = Path(..., description="Name of the table to search"),
     column: str = Query(..., description="Column to search in"),
     term: str = Query(..., description="Search term"),
-    limit: int = Query(50, description="Maximum number of results to return")
+    limit: int = Query(50, description="Maximum number of results to return"),
+    mode: str = Query("contains", pattern="^(contains|fuzzy)$", description="'contains' for substring matches, 'fuzzy' for typo-tolerant matches"),
+    threshold: float = Query(0.3, ge=0, le=1, description="Minimum similarity for fuzzy matches")
 ):
-    """Search for records in a table that match the given term."""
+    """Search for records in a table that match the given term.
+    
+    Catalog tables are matched on normalized text, so Latin transliterations
+    and mixed Cyrillic/Latin input (e.g. "akm", "5.45x39") find Ukrainian names.
+    """
     # Verify table exists
-    tables = db.get_tables()
-    if table_name not in tables:
+    if not await async_db.has_table(table_name):
         raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
     
     # Verify column exists
-    columns = db.get_column_names(table_name)
-    if column not in columns:
+    if not await async_db.has_column(table_name, column):
         raise HTTPException(status_code=400, detail=f"Column '{column}' not found in table '{table_name}'")
     
     # Perform search
-    results = db.search(table_name, column, term, limit)
+    if mode == "fuzzy":
+        if not db.cache.is_cacheable(table_name):
+            raise HTTPException(status_code=400, detail="Fuzzy search is only available for catalog tables")
+        matches = await async_db.fuzzy_search(table_name, column, term, limit, threshold)
+        results = [{**record, "_score": score} for record, score in matches]
+    else:
+        results = await async_db.search(table_name, column, term, limit)
     
     return {
         "table": table_name,
         "column": column,
         "term": term,
+        "mode": mode,
         "results": results,
         "count": len(results)
     }
 
-@app.get("/wiki/{category}")
+@app.get("/wiki/fulltext", dependencies=[Depends(require_catalog_ready)])
+async def full_text_search(
+    q: str = Query(..., description="Search text"),
+    tables: Optional[str] = Query(None, description="Comma-separated catalog tables to search (default: all)"),
+    limit: int = Query(20, description="Maximum number of results to return")
+):
+    """Relevance-ranked full-text search across the catalog text columns."""
+    table_list = None
+    if tables:
+        table_list = [t.strip() for t in tables.split(",") if t.strip()]
+        for table_name in table_list:
+            if not db.cache.is_cacheable(table_name):
+                raise HTTPException(status_code=404, detail=f"Catalog table '{table_name}' not found")
+    
+    results = await async_db.full_text_search(q, table_list, limit)
+    
+    return {
+        "query": q,
+        "results": results,
+        "count": len(results)
+    }
+
+def _export_default(value: Any):
+    """JSON encoding for the column types MySQL hands back"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+def _ndjson_chunks(batches):
+    for rows in batches:
+        yield "".join(json.dumps(row, ensure_ascii=False, default=_export_default) + "\n" for row in rows).encode("utf-8")
+
+def _csv_chunks(columns: List[str], batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so spreadsheet apps read the Cyrillic text as UTF-8
+    writer.writerow(columns)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([row.get(col) for col in columns] for row in rows)
+        yield buffer.getvalue().encode("utf-8")
+
+@app.get("/wiki/export/{table_name}", dependencies=[Depends(require_catalog_ready)])
+async def export_table(
+    table_name: str = Path(..., description="Name of the table to export"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$", description="'ndjson' or 'csv'")
+):
+    """Stream a whole table as NDJSON or CSV.
+    
+    Rows are read through an unbuffered server-side cursor and written out
+    batch by batch, so memory use does not grow with the table size.
+    """
+    # Verify table exists
+    if not await async_db.has_table(table_name):
+        raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
+    
+    # The generators are synchronous, so Starlette runs them on its threadpool
+    batches = db.stream_table(table_name)
+    if format == "csv":
+        columns = await async_db.get_column_names(table_name)
+        body, media_type = _csv_chunks(columns, batches), "text/csv; charset=utf-8"
+    else:
+        body, media_type = _ndjson_chunks(batches), "application/x-ndjson"
+    
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{table_name}.{format}"'}
+    )
+
+def _query_result_chunks(result, rows_per_chunk: int = 200):
+    """Write a QueryResult as {"results": [...], "count": ..., ...} piece by piece"""
+    yield '{"results":['
+    chunk = []
+    for i, row in enumerate(result):
+        chunk.append(row if i == 0 else "," + row)
+        if len(chunk) >= rows_per_chunk:
+            yield "".join(chunk)
+            chunk = []
+    summary = {"count": result.count, "truncated": result.truncated, "cached": result.cached}
+    if result.error:
+        summary["error"] = result.error
+    yield "".join(chunk) + "]," + json.dumps(summary)[1:]
+
+# Registered before /wiki/{category}, which would otherwise capture it
+@app.get("/wiki/query", dependencies=[Depends(require_state_ready), Depends(require_catalog_ready)])
+async def run_custom_query(
+    query: str = Query(..., description="SQL query to run (SELECT only)"),
+    explain: bool = Query(False, description="Return the query plan instead of running the query"),
+    max_rows: Optional[int] = Query(None, ge=1, description="Stop after this many rows (capped by the server limit)"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Run a custom SQL query (SELECT only, admin use only).
+    
+    Queries run under a server-side time limit and are cut off at a row and
+    byte cap; "truncated" in the response says whether that happened.
+    Identical queries are answered from a short-lived cache until data changes.
+    """
+    # Security check - only allow SELECT queries
+    try:
+        query = query_engine.prepare(query)
+    except QueryRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Check if current user is an admin/DM
+    if not current_user.get("is_dm", False):
+        raise HTTPException(status_code=403, detail="Only DMs can run custom queries")
+    
+    if explain:
+        try:
+            preview = await async_db.run(query_engine.explain, query)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Query error: {str(e)}")
+        return {"query": query, **preview}
+    
+    # Run the query; the first batch is read here so errors still get a proper status
+    try:
+        result = await async_db.run(query_engine.execute, query, max_rows)
+    except QueryTimeout as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Query error: {str(e)}")
+    
+    return StreamingResponse(
+        _query_result_chunks(result),
+        media_type="application/json",
+        headers={"X-Query-Cache": "hit" if result.cached else "miss"}
+    )
+
+@app.get("/wiki/{category}", dependencies=[Depends(require_catalog_ready)])
 async def get_category_data(
     category: str = Path(..., description="Category to retrieve"),
     limit: int = Query(100, description="Maximum number of records to return"),
@@ -749,7 +1240,7 @@ async def get_category_data(
     table_name = category_to_table.get(category.lower())
     if not table_name:
         # Check if the category directly matches a table name
-        tables = db.get_tables()
+        tables = await async_db.get_tables()
         if category.lower() in [t.lower() for t in tables]:
             table_name = next(t for t in tables if t.lower() == category.lower())
         else:
@@ -758,10 +1249,15 @@ async def get_category_data(
     # Get data
     if search:
         # Try to search in name column first, then in description if available
-        columns = db.get_column_names(table_name)
+        columns = await async_db.get_column_names(table_name)
         search_column = "name" if "name" in columns else columns[0]
         
-        results = db.search(table_name, search_column, search, limit)
+        if db.cache.is_cacheable(table_name):
+            # Catalog tables rank matches across all text columns first, then
+            # add the substring matches on the name column
+            results = await async_db.category_search(table_name, search_column, search, limit)
+        else:
+            results = await async_db.search(table_name, search_column, search, limit)
         return {
             "category": category,
             "data": results,
@@ -769,8 +1265,8 @@ async def get_category_data(
         }
     else:
         # Get paginated data
-        data = db.get_all(table_name, limit, offset)
-        total_count = db.count(table_name)
+        data = await async_db.get_all(table_name, limit, offset)
+        total_count = await async_db.count(table_name)
         
         return {
             "category": category,
@@ -783,7 +1279,7 @@ async def get_category_data(
             }
         }
 
-@app.get("/wiki/related/{table_name}/{record_id}")
+@app.get("/wiki/related/{table_name}/{record_id}", dependencies=[Depends(require_catalog_ready)])
 async def get_related_records(
     table_name: str = Path(..., description="Primary table name"),
     record_id: Any = Path(..., description="ID of the primary record"),
@@ -793,19 +1289,17 @@ async def get_related_records(
 ):
     """Get related records from another table that reference this record."""
     # Verify tables exist
-    tables = db.get_tables()
-    if table_name not in tables:
+    if not await async_db.has_table(table_name):
         raise HTTPException(status_code=404, detail=f"Table '{table_name}' not found")
-    if related_table not in tables:
+    if not await async_db.has_table(related_table):
         raise HTTPException(status_code=404, detail=f"Related table '{related_table}' not found")
     
     # Verify foreign key column exists in related table
-    columns = db.get_column_names(related_table)
-    if foreign_key not in columns:
+    if not await async_db.has_column(related_table, foreign_key):
         raise HTTPException(status_code=400, detail=f"Foreign key column '{foreign_key}' not found in table '{related_table}'")
     
     # Get related records
-    related = db.get_related(table_name, related_table, foreign_key, record_id, limit)
+    related = await async_db.get_related(table_name, related_table, foreign_key, record_id, limit)
     
     return {
         "table": table_name,
@@ -815,39 +1309,61 @@ async def get_related_records(
         "count": len(related)
     }
 
-# Optional: Add a catch-all route for flexible custom queries (admin only)
-@app.get("/wiki/query")
-async def run_custom_query(
-    query: str = Query(..., description="SQL query to run (SELECT only)"),
+@app.post("/wiki/reload", dependencies=[Depends(require_state_ready), Depends(require_catalog_ready)])
+async def reload_catalog(
+    force: bool = Query(False, description="Re-diff every CSV even if its checksum is unchanged"),
     current_user: dict = Depends(get_current_user)
 ):
-    """Run a custom SQL query (SELECT only, admin use only)."""
-    # Security check - only allow SELECT queries
-    query = query.strip()
-    if not query.upper().startswith("SELECT"):
-        raise HTTPException(status_code=400, detail="Only SELECT queries are allowed")
-    
-    # Check if current user is an admin/DM
+    """Incrementally reload catalog tables from changed CSV files (DM only)."""
     if not current_user.get("is_dm", False):
-        raise HTTPException(status_code=403, detail="Only DMs can run custom queries")
+        raise HTTPException(status_code=403, detail="Only DMs can reload the catalog")
     
-    # Run the query
     try:
-        results = db.run_custom_query(query)
-        return {"results": results, "count": len(results) if isinstance(results, list) else 0}
+        reports = await async_db.run(db.sync_catalog, None, force)
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Query error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Catalog reload failed: {str(e)}")
+    
+    return {
+        "files": reports,
+        "changed": sum(1 for r in reports if r["changed"]),
+        "upserted": sum(r["upserted"] for r in reports),
+        "deleted": sum(r["deleted"] for r in reports)
+    }
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint.
+
+    Metrics are kept per process: with several workers (WEB_CONCURRENCY)
+    each scrape shows only the worker that answered it.
+    """
+    return Response(content=metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/debug/db", dependencies=[Depends(require_state_ready)])
+async def database_debug(
+    limit: int = Query(50, ge=1, le=200, description="Number of recent requests to include"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Per-route query counts, recent request traces and repeated-query (N+1) reports (DM only)."""
+    if not current_user.get("is_dm", False):
+        raise HTTPException(status_code=403, detail="Only DMs can view database diagnostics")
+    
+    return {
+        **request_log.report(limit),
+        "pool": db.pool_stats(),
+        "catalog_cache": db.cache.stats(),
+        "query_engine": query_engine.stats(),
+        "token_cache": token_cache.stats(),
+        "state": state_backend.status()
+    }
 
 # --- AUTHENTICATION ENDPOINTS ---
 
-@app.post("/token", response_model=Token)
+@app.post("/token", response_model=Token, dependencies=[Depends(require_state_ready)])
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = None
-    for user_id, user_data in users_db.items():
-        if user_data["email"] == form_data.username:
-            if verify_password(form_data.password, user_data["hashed_password"]):
-                user = {"id": user_id, **user_data}
-                break
+    user = find_user_by_email(form_data.username)
+    if user and not await verify_password(form_data.password, user["hashed_password"]):
+        user = None
     
     if not user:
         raise HTTPException(
@@ -862,18 +1378,24 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
-@app.post("/register", response_model=User)
+@app.post("/register", response_model=User, dependencies=[Depends(require_state_ready)])
 async def register_user(user: UserCreate):
     # Check if email already exists
-    for user_data in users_db.values():
-        if user_data["email"] == user.email:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
+    if users_db.has_value("email", user.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     
     user_id = str(uuid.uuid4())
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash(user.password)
+    
+    # The same email may have been registered while the password was hashing
+    if users_db.has_value("email", user.email):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
     
     users_db[user_id] = {
         "email": user.email,
@@ -883,7 +1405,7 @@ async def register_user(user: UserCreate):
     }
 
     game_id = str(uuid.uuid4())
-    game_code = generate_game_code()
+    game_code = allocate_game_code()
     games_db[game_id] = {
         "dm_id": user_id,
         "game_code": game_code,
@@ -902,7 +1424,7 @@ async def register_user(user: UserCreate):
 
 # --- GAME MANAGEMENT ENDPOINTS ---
 
-@app.post("/games")
+@app.post("/games", dependencies=[Depends(require_state_ready)])
 async def create_game(
     game: GameCreate,  # Change to use GameCreate model
     current_user: dict = Depends(get_current_user)
@@ -915,11 +1437,7 @@ async def create_game(
         )
     
     game_id = str(uuid.uuid4())
-    game_code = generate_game_code()
-    
-    # Ensure game code is unique
-    while any(g["game_code"] == game_code for g in games_db.values()):
-        game_code = generate_game_code()
+    game_code = allocate_game_code()
     
     games_db[game_id] = {
         "dm_id": current_user["id"],
@@ -946,15 +1464,7 @@ async def get_current_user_or_none(
         return None
         
     try:
-        payload = pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-            
-        for user_id, user_data in users_db.items():
-            if user_data["email"] == email:
-                return {"id": user_id, **user_data}
-                
+        return resolve_token_user(token)
     except:
         pass
         
@@ -966,7 +1476,7 @@ class JoinGameRequest(BaseModel):
 
 # Replace the existing join_game function with this updated version
 
-@app.post("/games/join")
+@app.post("/games/join", dependencies=[Depends(require_state_ready)])
 async def join_game(
     join_data: JoinGameRequest,
     current_user: Optional[dict] = Depends(get_current_user_or_none)
@@ -976,11 +1486,9 @@ async def join_game(
     found_game = None
     
     # Find game with matching code
-    for g_id, game in games_db.items():
-        if game["game_code"] == join_data.game_code:
-            game_id = g_id
-            found_game = game
-            break
+    match = games_db.get_by("game_code", join_data.game_code)
+    if match:
+        game_id, found_game = match
     
     if not game_id:
         raise HTTPException(
@@ -992,6 +1500,7 @@ async def join_game(
         # Registered user flow
         if current_user["id"] not in found_game["players"]:
             games_db[game_id]["players"].append(current_user["id"])
+            games_db.touch(game_id)
         
         # Return game info without creating a character
         return {
@@ -1020,6 +1529,7 @@ async def join_game(
         
         # Add guest to players list
         games_db[game_id]["players"].append(guest_id)
+        games_db.touch(game_id)
         
         # Generate session token for the guest
         access_token_expires = timedelta(hours=12)  # Guest sessions last 12 hours
@@ -1040,19 +1550,15 @@ async def join_game(
         }
 # --- CHARACTER & INVENTORY ENDPOINTS ---
 
-@app.get("/characters", response_model=List[Character])
+@app.get("/characters", response_model=List[Character], dependencies=[Depends(require_state_ready)])
 async def get_characters(current_user: dict = Depends(get_current_user)):
     user_characters = []
-    for character_id, character in characters_db.items():
-        if character["user_id"] == current_user["id"]:
-            user_characters.append({
-                "id": character_id,
-                **character
-            })
+    for character_id in characters_db.find("user_id", current_user["id"]):
+        user_characters.append(character_view(character_id, characters_db[character_id]))
     
     return user_characters
 
-@app.get("/characters/{character_id}", response_model=Character)
+@app.get("/characters/{character_id}", response_model=Character, dependencies=[Depends(require_state_ready)])
 async def get_character(character_id: str, current_user: dict = Depends(get_current_user)):
     if character_id not in characters_db:
         raise HTTPException(
@@ -1071,11 +1577,8 @@ async def get_character(character_id: str, current_user: dict = Depends(get_curr
                 detail="You don't have access to this character"
             )
     
-    return {
-        "id": character_id,
-        **character
-    }
-@app.get("/games/{game_id}/characters/{character_id}")
+    return character_view(character_id, character)
+@app.get("/games/{game_id}/characters/{character_id}", dependencies=[Depends(require_state_ready)])
 async def get_character_details(
     game_id: str,
     character_id: str,
@@ -1150,8 +1653,12 @@ async def get_character_details(
         "personality": character.get("personality", {}),
         "money": character.get("money", 0),
         "capacity": character.get("capacity", 50),
-        "inventory": character.get("inventory", []),
+        "inventory": character["inventory"].to_list() if "inventory" in character else [],
         "equipment": character.get("equipment", {}),
+        # Kept up to date by the inventory and equipment endpoints, not re-summed here
+        "encumbrance": encumbrance(character.get("inventory") or Inventory(),
+                                   character.get("equipment") or Equipment(),
+                                   character.get("capacity", 50)),
         "avatar_url": character.get("avatar_url"),
         
         "radiation": environment_data["radiation"],
@@ -1161,102 +1668,40 @@ async def get_character_details(
     
     return response
 
-@app.post("/characters/{character_id}/inventory", response_model=InventoryItem)
-async def add_inventory_item(
-    character_id: str, 
-    item: InventoryCreate,
-    current_user: dict = Depends(get_current_user)
-):
-    if character_id not in characters_db:
-        raise HTTPException(status_code=404, detail="Character not found")
-    
-    character = characters_db[character_id]
-    
-    # Calculate next item ID
-    next_id = 1
-    if character["inventory"]:
-        next_id = max(item["id"] for item in character["inventory"]) + 1
-    
-    # Create new item
-    new_item = {
-        "id": next_id,
+# Inventory changes shared by the single-item endpoints and the batch endpoint.
+# Each works on a character record and raises HTTPException when it cannot apply.
+
+def apply_add_item(character: dict, item: InventoryCreate) -> dict:
+    # The inventory hands out the next id; ids are never reused
+    return character["inventory"].add({
         **item.dict(),
         "total_weight": item.weight * item.quantity
-    }
-    
-    character["inventory"].append(new_item)
-    
-    return new_item
+    })
 
-@app.put("/characters/{character_id}/inventory/{item_id}", response_model=InventoryItem)
-async def update_inventory_item(
-    character_id: str,
-    item_id: int,
-    item: InventoryCreate,
-    current_user: dict = Depends(get_current_user)
-):
-    if character_id not in characters_db:
-        raise HTTPException(status_code=404, detail="Character not found")
-    
-    character = characters_db[character_id]
-    
-    for i, existing_item in enumerate(character["inventory"]):
-        if existing_item["id"] == item_id:
-            updated_item = {
-                "id": item_id,
-                **item.dict(),
-                "total_weight": item.weight * item.quantity
-            }
-            character["inventory"][i] = updated_item
-            return updated_item
+def apply_update_item(character: dict, item_id: int, item: InventoryCreate) -> dict:
+    if item_id not in character["inventory"]:
+        raise HTTPException(status_code=404, detail="Item not found")
     
-    raise HTTPException(status_code=404, detail="Item not found")
+    return character["inventory"].replace(item_id, {
+        **item.dict(),
+        "total_weight": item.weight * item.quantity
+    })
 
-@app.delete("/characters/{character_id}/inventory/{item_id}")
-async def delete_inventory_item(
-    character_id: str,
-    item_id: int,
-    quantity: int = 1,
-    current_user: dict = Depends(get_current_user)
-):
-    if character_id not in characters_db:
-        raise HTTPException(status_code=404, detail="Character not found")
+def apply_remove_item(character: dict, item_id: int, quantity: int) -> dict:
+    item = character["inventory"].get(item_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
     
-    character = characters_db[character_id]
+    if quantity >= item["quantity"]:
+        # Remove the item completely
+        character["inventory"].remove(item_id)
+        return {"item_id": item_id, "quantity": 0}
     
-    for i, item in enumerate(character["inventory"]):
-        if item["id"] == item_id:
-            if quantity >= item["quantity"]:
-                # Remove the item completely
-                character["inventory"].pop(i)
-            else:
-                # Reduce the quantity
-                item["quantity"] -= quantity
-                item["total_weight"] = item["weight"] * item["quantity"]
-            
-            return {"message": "Item updated successfully"}
-    
-    raise HTTPException(status_code=404, detail="Item not found")
+    # Reduce the quantity
+    character["inventory"].set_quantity(item_id, item["quantity"] - quantity)
+    return {"item_id": item_id, "quantity": item["quantity"]}
 
-from fastapi import FastAPI, HTTPException, Depends, status, Body
-# Add Body to your imports at the top
-
-# Then replace your equipment endpoint with this version:
-@app.put("/characters/{character_id}/equipment")
-async def equip_item(
-    character_id: str,
-    equipment_data: dict = Body(...),  # Use Body to get data from request body
-    current_user: dict = Depends(get_current_user)
-):
-    if character_id not in characters_db:
-        raise HTTPException(status_code=404, detail="Character not found")
-    
-    character = characters_db[character_id]
-    
-    # Get parameters from the request body
-    slot_type = equipment_data.get("slot_type")
-    item_id = equipment_data.get("item_id")
-    
+def apply_equip(character: dict, slot_type: Optional[str], item_id: Optional[int]) -> dict:
     if not slot_type:
         raise HTTPException(status_code=400, detail="slot_type is required")
     
@@ -1271,19 +1716,12 @@ async def equip_item(
         
         # If there was an item, add it back to inventory
         if current_item:
-            character["inventory"].append(current_item)
+            character["inventory"].put(current_item)
         
         return {"message": f"Item removed from {slot_type}"}
     
     # Find item in inventory
-    item_index = None
-    item = None
-    for i, inv_item in enumerate(character["inventory"]):
-        if inv_item["id"] == item_id:
-            item_index = i
-            item = inv_item
-            break
-    
+    item = character["inventory"].get(item_id)
     if item is None:
         raise HTTPException(status_code=404, detail="Item not found in inventory")
     
@@ -1307,15 +1745,88 @@ async def equip_item(
     character["equipment"][slot_type] = item
     
     # Remove from inventory
-    character["inventory"].pop(item_index)
+    character["inventory"].remove(item_id)
     
     # Add previously equipped item back to inventory if there was one
     if current_item:
-        character["inventory"].append(current_item)
+        character["inventory"].put(current_item)
     
     return {"message": f"Item equipped in {slot_type} slot"}
 
-@app.put("/characters/{character_id}/money")
+def apply_money(character: dict, amount: int) -> dict:
+    # Update money
+    character["money"] += amount
+    
+    # Ensure money doesn't go negative
+    if character["money"] < 0:
+        character["money"] = 0
+    
+    return {"money": character["money"]}
+
+@app.post("/characters/{character_id}/inventory", response_model=InventoryItem, dependencies=[Depends(require_state_ready)])
+async def add_inventory_item(
+    character_id: str, 
+    item: InventoryCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    if character_id not in characters_db:
+        raise HTTPException(status_code=404, detail="Character not found")
+    
+    new_item = apply_add_item(characters_db[character_id], item)
+    characters_db.touch(character_id)
+    
+    return new_item
+
+@app.put("/characters/{character_id}/inventory/{item_id}", response_model=InventoryItem, dependencies=[Depends(require_state_ready)])
+async def update_inventory_item(
+    character_id: str,
+    item_id: int,
+    item: InventoryCreate,
+    current_user: dict = Depends(get_current_user)
+):
+    if character_id not in characters_db:
+        raise HTTPException(status_code=404, detail="Character not found")
+    
+    updated_item = apply_update_item(characters_db[character_id], item_id, item)
+    characters_db.touch(character_id)
+    return updated_item
+
+@app.delete("/characters/{character_id}/inventory/{item_id}", dependencies=[Depends(require_state_ready)])
+async def delete_inventory_item(
+    character_id: str,
+    item_id: int,
+    quantity: int = Query(1, ge=1),
+    current_user: dict = Depends(get_current_user)
+):
+    if character_id not in characters_db:
+        raise HTTPException(status_code=404, detail="Character not found")
+    
+    apply_remove_item(characters_db[character_id], item_id, quantity)
+    characters_db.touch(character_id)
+    
+    return {"message": "Item updated successfully"}
+
+from fastapi import FastAPI, HTTPException, Depends, status, Body
+# Add Body to your imports at the top
+
+# Then replace your equipment endpoint with this version:
+@app.put("/characters/{character_id}/equipment", dependencies=[Depends(require_state_ready)])
+async def equip_item(
+    character_id: str,
+    equipment_data: dict = Body(...),  # Use Body to get data from request body
+    current_user: dict = Depends(get_current_user)
+):
+    if character_id not in characters_db:
+        raise HTTPException(status_code=404, detail="Character not found")
+    
+    # Get parameters from the request body
+    result = apply_equip(characters_db[character_id],
+                         equipment_data.get("slot_type"), equipment_data.get("item_id"))
+    characters_db.touch(character_id)
+    
+    return result
+
+@app.put("/characters/{character_id}/money", dependencies=[Depends(require_state_ready)])
 async def update_money(
     character_id: str,
     money_data: dict = Body(...),
@@ -1324,19 +1835,86 @@ async def update_money(
     if character_id not in characters_db:
         raise HTTPException(status_code=404, detail="Character not found")
     
-    character = characters_db[character_id]
-    
     # Get amount from request body
-    amount = money_data.get("amount", 0)
+    result = apply_money(characters_db[character_id], money_data.get("amount", 0))
+    characters_db.touch(character_id)
     
-    # Update money
-    character["money"] += amount
+    return result
+
+@app.post("/inventory/batch", dependencies=[Depends(require_state_ready)])
+async def batch_inventory(
+    batch: InventoryBatch,
+    current_user: dict = Depends(get_current_user)
+):
+    """Apply many inventory, equipment and money operations in one request.
     
-    # Ensure money doesn't go negative
-    if character["money"] < 0:
-        character["money"] = 0
+    Operations run in order and may span several characters the caller owns
+    or runs the game for. They are all-or-nothing: each character is changed
+    on a copy, and the copies replace the originals only if every operation
+    succeeded. The response lists one result per operation.
+    """
+    if len(batch.operations) > MAX_BATCH_OPERATIONS:
+        raise HTTPException(status_code=400,
+                            detail=f"A batch may hold at most {MAX_BATCH_OPERATIONS} operations")
+    
+    # Look up and authorize each character once, and work on copies
+    working = {}
+    for operation in batch.operations:
+        character_id = operation.character_id
+        if character_id in working:
+            continue
+        character = characters_db.get(character_id)
+        if character is None or "inventory" not in character:
+            raise HTTPException(status_code=404, detail=f"Character {character_id} not found")
+        if character["user_id"] != current_user["id"]:
+            game = games_db.get(character["game_id"])
+            if not game or game["dm_id"] != current_user["id"]:
+                raise HTTPException(status_code=403,
+                                    detail=f"You don't have permission to change character {character_id}")
+        working[character_id] = {
+            **character,
+            "inventory": character["inventory"].copy(),
+            "equipment": character["equipment"].copy()
+        }
     
-    return {"money": character["money"]}
+    results = []
+    for index, operation in enumerate(batch.operations):
+        character = working[operation.character_id]
+        try:
+            if operation.op == "add":
+                if operation.item is None:
+                    raise HTTPException(status_code=400, detail="item is required")
+                result = apply_add_item(character, operation.item)
+            elif operation.op == "update":
+                if operation.item is None or operation.item_id is None:
+                    raise HTTPException(status_code=400, detail="item_id and item are required")
+                result = apply_update_item(character, operation.item_id, operation.item)
+            elif operation.op == "remove":
+                if operation.item_id is None:
+                    raise HTTPException(status_code=400, detail="item_id is required")
+                result = apply_remove_item(character, operation.item_id, operation.quantity)
+            elif operation.op == "equip":
+                result = apply_equip(character, operation.slot_type, operation.item_id)
+            else:
+                result = apply_money(character, operation.amount)
+        except HTTPException as e:
+            # Nothing has been stored yet, so dropping the copies undoes the batch
+            raise HTTPException(status_code=e.status_code, detail={
+                "message": f"Operation {index} failed; no changes were made",
+                "failed_index": index,
+                "error": e.detail,
+                "results": [{**done, "status": "rolled_back"} for done in results]
+                           + [{"index": index, "op": operation.op, "character_id": operation.character_id,
+                               "status": "failed", "error": e.detail}]
+            })
+        # Items are returned as they are now, not as later operations leave them
+        results.append({"index": index, "op": operation.op, "character_id": operation.character_id,
+                        "status": "ok", "result": dict(result)})
+    
+    for character_id, character in working.items():
+        characters_db[character_id] = character
+    
+    return {"applied": len(results), "results": results}
 
 dist_path = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "dist"))
 
@@ -1376,16 +1954,16 @@ def create_sample_inventory():
             "total_weight": 1.2
         },
         {
-            "id": 2,
+            "id": 3,
             "name": "9mm Magazine (12 rounds)",
             "type": "magazine",
             "quantity": 1,
             "weight": 0.2,
             "notes": "Standard ammunition",
-            "total_weight": 1.2
+            "total_weight": 0.2
         },
         {
-            "id": 3,
+            "id": 4,
             "name": "Anti-radiation drugs",
             "type": "medication",
             "quantity": 5,
@@ -1394,7 +1972,7 @@ def create_sample_inventory():
             "total_weight": 0.5
         },
         {
-            "id": 4,
+            "id": 5,
             "name": "SEVA Suit",
             "type": "armor",
             "quantity": 1,
@@ -1404,7 +1982,7 @@ def create_sample_inventory():
             "quick_slots": 2
         },
         {
-            "id": 5,
+            "id": 6,
             "name": "SSP-99 Ecologist Helmet",
             "type": "headgear",
             "quantity": 1,
@@ -1414,7 +1992,7 @@ def create_sample_inventory():
             "quick_slots": 1
         },
         {
-            "id": 6,
+            "id": 7,
             "name": "Detector",
             "type": "tool",
             "quantity": 1,
@@ -1423,7 +2001,7 @@ def create_sample_inventory():
             "total_weight": 0.5
         },
         {
-            "id": 7,
+            "id": 8,
             "name": "PMm Pistol",
             "type": "pistol",
             "quantity": 1,
@@ -1438,6 +2016,8 @@ def create_sample_character(user_id, game_id, character_name=None):
     character_id = "1c5293ee-d3bd-4e7b-b91f-bb4f9f56a8a3"
     print(character_id)
     inventory_items = create_sample_inventory()
+    # Equipped items keep their ids, so new ids start after all of them
+    next_item_id = max(item["id"] for item in inventory_items) + 1
     
     # Create equipment from inventory items
     equipment = {
@@ -1470,10 +2050,9 @@ def create_sample_character(user_id, game_id, character_name=None):
     if not character_name:
         # Get username from users_db
         username = "New Stalker"
-        for user_data in users_db.values():
-            if user_data.get("id") == user_id:
-                username = user_data.get("username", "Stalker")
-                break
+        user_data = users_db.get(user_id)
+        if user_data:
+            username = user_data.get("username", "Stalker")
         character_name = f"{username}'s Character"
     
     characters_db[character_id] = {
@@ -1483,8 +2062,8 @@ def create_sample_character(user_id, game_id, character_name=None):
         "name": character_name,
         "money": 10000,
         "capacity": 80,
-        "inventory": inventory_items,
-        "equipment": equipment
+        "inventory": Inventory(inventory_items, next_item_id),
+        "equipment": Equipment(equipment)
     }
     
     return character_id
@@ -1507,7 +2086,7 @@ async def get_item_types():
         print(f"Error in get_item_types: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/items/{category}")
+@app.get("/api/items/{category}", dependencies=[Depends(require_catalog_ready)])
 async def get_items_by_category(category: str):
     """Get all items from a specific category"""
     try:
@@ -1527,7 +2106,7 @@ async def get_items_by_category(category: str):
             print(f"Category not found: {category}")
             raise HTTPException(status_code=404, detail=f"Category {category} not found")
             
-        items = db.get_all(table_name)
+        items = await async_db.get_all(table_name)
         print(f"Found {len(items)} items in category {category}")
         
         # Format the response based on category-specific fields
@@ -1561,7 +2140,7 @@ async def get_items_by_category(category: str):
     
 
 
-@app.get("/games")
+@app.get("/games", dependencies=[Depends(require_state_ready)])
 async def get_user_games(current_user: dict = Depends(get_current_user)):
     """Get all games where the user is either DM or player"""
     user_games = []
@@ -1582,7 +2161,7 @@ async def get_user_games(current_user: dict = Depends(get_current_user)):
     
     return user_games
     
-@app.put("/games/{game_id}")
+@app.put("/games/{game_id}", dependencies=[Depends(require_state_ready)])
 async def update_game(
     game_id: str,
     game: GameUpdate,
@@ -1596,6 +2175,7 @@ async def update_game(
         raise HTTPException(status_code=403, detail="Only the DM can update this game")
     
     games_db[game_id]["name"] = game.name
+    games_db.touch(game_id)
     
     return {
         "id": game_id,
@@ -1605,7 +2185,7 @@ async def update_game(
         "created_at": games_db[game_id].get("created_at", datetime.now().isoformat())
     }
 
-@app.delete("/games/{game_id}")
+@app.delete("/games/{game_id}", dependencies=[Depends(require_state_ready)])
 async def delete_game(
     game_id: str,
     current_user: dict = Depends(get_current_user)
@@ -1617,23 +2197,14 @@ async def delete_game(
     if games_db[game_id]["dm_id"] != current_user["id"]:
         raise HTTPException(status_code=403, detail="Only the DM can delete this game")
     
-    # Delete the game
-    del games_db[game_id]
-    
-    # Also delete any associated characters
-    characters_to_delete = []
-    for char_id, character in characters_db.items():
-        if character["game_id"] == game_id:
-            characters_to_delete.append(char_id)
-    
-    for char_id in characters_to_delete:
-        del characters_db[char_id]
+    # Delete the game with its characters, their quests and notes, and its map pins
+    delete_game_cascade(game_id)
     
     return {"message": "Game deleted successfully"}
 
 # Add this endpoint for getting characters in a game
 
-@app.get("/games/{game_id}/characters")
+@app.get("/games/{game_id}/characters", dependencies=[Depends(require_state_ready)])
 async def get_game_characters(
     game_id: str,
     current_user: dict = Depends(get_current_user)
@@ -1646,8 +2217,9 @@ async def get_game_characters(
     game_characters = []
     
     # Get all characters for this game that belong to the current user
-    for character_id, character in characters_db.items():
-        if character["game_id"] == game_id and character["user_id"] == current_user["id"]:
+    for character_id in characters_db.find("game_id", game_id):
+        character = characters_db[character_id]
+        if character["user_id"] == current_user["id"]:
             game_characters.append({
                 "id": character_id,
                 "name": character["name"],
@@ -1661,7 +2233,7 @@ async def get_game_characters(
         "characters": game_characters
     }
 
-@app.post("/games/{game_id}/characters")
+@app.post("/games/{game_id}/characters", dependencies=[Depends(require_state_ready)])
 async def create_game_character(
     game_id: str,
     character_data: dict = Body(...),
@@ -1696,8 +2268,8 @@ async def create_game_character(
         "name": character_name,
         "money": 10000,
         "capacity": 80,
-        "inventory": inventory_items,
-        "equipment": equipment
+        "inventory": Inventory(inventory_items),
+        "equipment": Equipment(equipment)
     }
     
     return {
@@ -1707,7 +2279,7 @@ async def create_game_character(
         "capacity": 80
     }
     
-@app.post("/games/{game_id}/character/create")
+@app.post("/games/{game_id}/character/create", dependencies=[Depends(require_state_ready)])
 async def create_detailed_character(
     game_id: str,
     character_data: CharacterCreationRequest,
@@ -1744,8 +2316,8 @@ async def create_detailed_character(
         "passivePerception": character_data.passivePerception or 10,
         "money": 50000,
         "capacity": 80,
-        "inventory": [],
-        "equipment": equipment
+        "inventory": Inventory(),
+        "equipment": Equipment(equipment)
     }
     
     return {
@@ -1756,7 +2328,7 @@ async def create_detailed_character(
         "capacity": 80
     }
 
-@app.get("/games/{game_id}/pins")
+@app.get("/games/{game_id}/pins", dependencies=[Depends(require_state_ready)])
 async def get_game_pins(game_id: str, current_user: dict = Depends(get_current_user_or_none)):
     """Get all character pins for a game"""
     # Check if game exists
@@ -1773,21 +2345,22 @@ async def get_game_pins(game_id: str, current_user: dict = Depends(get_current_u
     
     # Get all characters in the game
     game_characters = []
-    for char_id, char_data in characters_db.items():
-        if char_data["game_id"] == game_id:
-            game_characters.append({
-                "id": char_id,
-                "name": char_data["name"],
-                "user_id": char_data["user_id"],
-                "avatar_url": char_data.get("avatar_url", None),
-                "is_monster": char_data.get("is_monster", False)
-            })
+    for char_id in characters_db.find("game_id", game_id):
+        char_data = characters_db[char_id]
+        game_characters.append({
+            "id": char_id,
+            "name": char_data["name"],
+            "user_id": char_data["user_id"],
+            "avatar_url": char_data.get("avatar_url", None),
+            "is_monster": char_data.get("is_monster", False)
+        })
     
     # Get or initialize pin positions
     if game_id not in pins_db:
         pins_db[game_id] = {}
     
     pins = []
+    placed = False
     for char in game_characters:
         # Get the character's position or create default
         if char["id"] not in pins_db[game_id]:
@@ -1797,6 +2370,7 @@ async def get_game_pins(game_id: str, current_user: dict = Depends(get_current_u
                 "y": 500,  # Default Y position (center of map)
                 "last_updated": datetime.now().isoformat()
             }
+            placed = True
         
         position = pins_db[game_id][char["id"]]
         
@@ -1810,9 +2384,12 @@ async def get_game_pins(game_id: str, current_user: dict = Depends(get_current_u
             "is_current_user": current_user and current_user["id"] == char["user_id"]
         })
     
+    if placed:
+        pins_db.touch(game_id)
+    
     return {"pins": pins}
 
-@app.put("/games/{game_id}/pins/{character_id}/position")
+@app.put("/games/{game_id}/pins/{character_id}/position", dependencies=[Depends(require_state_ready)])
 async def update_pin_position(
     game_id: str,
     character_id: str,
@@ -1851,6 +2428,7 @@ async def update_pin_position(
         "y": position_data.y,
         "last_updated": datetime.now().isoformat()
     }
+    pins_db.touch(game_id)
     
     return {
         "status": "success",
@@ -1860,7 +2438,7 @@ async def update_pin_position(
             "y": position_data.y
         }
     }
-@app.post("/games/{game_id}/monsters")
+@app.post("/games/{game_id}/monsters", dependencies=[Depends(require_state_ready)])
 async def create_monster_pin(
     game_id: str,
     monster_data: MonsterPinCreate,
@@ -1899,6 +2477,7 @@ async def create_monster_pin(
         "y": monster_data.position_y,
         "last_updated": datetime.now().isoformat()
     }
+    pins_db.touch(game_id)
     
     return {
         "character_id": monster_id,
@@ -1907,7 +2486,7 @@ async def create_monster_pin(
         "position_y": monster_data.position_y,
         "is_monster": True
     }
-@app.get("/games/{game_id}")
+@app.get("/games/{game_id}", dependencies=[Depends(require_state_ready)])
 async def get_game_by_id(
     game_id: str,
     current_user: dict = Depends(get_current_user_or_none)
@@ -1944,4 +2523,8 @@ async def serve_spa(path: str):
 # Run the application
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=4000)
\ No newline at end of file
+    workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+    if workers > 1 and not state_backend.shared:
+        raise SystemExit("Running several workers needs STATE_BACKEND=mysql so they share one game state")
+    # Workers import the app themselves, so it is passed by name
+    uvicorn.run("main:app" if workers > 1 else app, host="0.0.0.0", port=4000, workers=workers)
\ No newline at end of file
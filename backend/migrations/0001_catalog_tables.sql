@@ -0,0 +1,114 @@
+-- Catalog reference tables loaded from data/import/*.csv
+
+CREATE TABLE IF NOT EXISTS ammo (
+    id VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    type ENUM('normal', 'HP', 'AP'),
+    special TEXT,
+    weight DECIMAL(4,2),
+    avg_price INT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS armor (
+    id VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    physical INT,
+    radioactive INT,
+    chemical INT,
+    thermal INT,
+    electric INT,
+    psy INT,
+    artefact_slots INT,
+    quick_slots INT,
+    reliability INT,
+    weight DECIMAL(4,2),
+    special TEXT,
+    avg_price INT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    id VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    property TEXT,
+    source ENUM('gravitational anomlaies',
+                'thermal anomalies',
+                'electric anomalies',
+                'toxic anomalies'),
+    rarity ENUM('common',
+                'uncommon',
+                'rare',
+                'legendary',
+                'archi-artifact'),
+    weight DECIMAL(4,2),
+    avg_price INT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS beasts (
+    id VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    size ENUM('small', 'medium', 'large', 'humanoid'),
+    description TEXT,
+    abilities TEXT,
+    HP INT,
+    agility INT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS food (
+    id VARCHAR(50) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    food_points INT,
+    weight DECIMAL(4,2),
+    avg_price INT,
+    bonus TEXT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS medicine (
+    id VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    property TEXT,
+    weight DECIMAL(4,2),
+    avg_price INT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS weapons (
+    id VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    type VARCHAR(50),
+    d4 INT DEFAULT 0,
+    d6 INT DEFAULT 0,
+    d8 INT DEFAULT 0,
+    d10 INT DEFAULT 0,
+    d12 INT DEFAULT 0,
+    d20 INT DEFAULT 0,
+    rof INT,
+    `range` ENUM('close', 'medium', 'long'),
+    calibre VARCHAR(50),
+    reliability INT,
+    weight DECIMAL(4,2),
+    capacity INT,
+    avg_price INT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS anomalies (
+    id VARCHAR(20) PRIMARY KEY,
+    name VARCHAR(100) NOT NULL,
+    strength ENUM('weak',
+                'normal',
+                'strong',
+                'charged'),
+    d4 INT DEFAULT 0,
+    d6 INT DEFAULT 0,
+    d8 INT DEFAULT 0,
+    d10 INT DEFAULT 0,
+    d12 INT DEFAULT 0,
+    d20 INT DEFAULT 0,
+    type ENUM('gravity',
+            'electric',
+            'thermal',
+            'toxic',
+            'special'),
+    visibility ENUM('almost invisible',
+                    'invisible',
+                    'visible'),
+    behavior TEXT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,19 @@
+-- Bookkeeping for incremental catalog reloads: one row per CSV file and
+-- one hash per catalog row
+
+CREATE TABLE IF NOT EXISTS catalog_files (
+    file_path VARCHAR(255) PRIMARY KEY,
+    table_name VARCHAR(64) NOT NULL,
+    content_hash CHAR(64) NOT NULL,
+    row_count INT NOT NULL,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS catalog_rows (
+    table_name VARCHAR(64) NOT NULL,
+    row_id VARCHAR(50) NOT NULL,
+    source_file VARCHAR(255) NOT NULL,
+    row_hash CHAR(40) NOT NULL,
+    PRIMARY KEY (table_name, row_id),
+    INDEX idx_catalog_rows_source (source_file)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
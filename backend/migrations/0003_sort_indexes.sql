@@ -0,0 +1,19 @@
+-- (column, primary key) indexes for the numeric columns the wiki sorts by,
+-- so keyset pagination on /wiki/tables/{table_name} is an index range scan.
+-- Built in place without blocking reads or writes.
+
+CREATE INDEX idx_ammo_weight ON `ammo` (`weight`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_ammo_avg_price ON `ammo` (`avg_price`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_armor_weight ON `armor` (`weight`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_armor_avg_price ON `armor` (`avg_price`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_armor_reliability ON `armor` (`reliability`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_artifacts_weight ON `artifacts` (`weight`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_artifacts_avg_price ON `artifacts` (`avg_price`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_beasts_hp ON `beasts` (`HP`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_food_weight ON `food` (`weight`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_food_avg_price ON `food` (`avg_price`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_medicine_weight ON `medicine` (`weight`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_medicine_avg_price ON `medicine` (`avg_price`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_weapons_weight ON `weapons` (`weight`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_weapons_avg_price ON `weapons` (`avg_price`, `id`) ALGORITHM=INPLACE LOCK=NONE;
+CREATE INDEX idx_weapons_reliability ON `weapons` (`reliability`, `id`) ALGORITHM=INPLACE LOCK=NONE;
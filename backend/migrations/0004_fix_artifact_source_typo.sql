@@ -0,0 +1,15 @@
+-- Fix the 'gravitational anomlaies' typo in artifacts.source: add the
+-- corrected value, move rows over, then drop the misspelled one
+
+ALTER TABLE artifacts MODIFY source ENUM('gravitational anomlaies',
+                                         'thermal anomalies',
+                                         'electric anomalies',
+                                         'toxic anomalies',
+                                         'gravitational anomalies');
+
+UPDATE artifacts SET source = 'gravitational anomalies' WHERE source = 'gravitational anomlaies';
+
+ALTER TABLE artifacts MODIFY source ENUM('gravitational anomalies',
+                                         'thermal anomalies',
+                                         'electric anomalies',
+                                         'toxic anomalies');
@@ -0,0 +1,11 @@
+-- Durable copy of the in-memory game state (users, games, characters, ...),
+-- written behind by persistence.StatePersistence: one JSON document per record
+
+CREATE TABLE IF NOT EXISTS state_records (
+    store VARCHAR(32) NOT NULL,
+    record_key VARCHAR(64) NOT NULL,
+    data LONGTEXT NOT NULL,
+    seq BIGINT NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (store, record_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,16 @@
+-- Shared game state for multiple workers (shared_state.SharedStateBackend):
+-- per-record versions for optimistic concurrency, tombstones (data NULL) so
+-- deletes reach other workers, and one global change sequence
+
+ALTER TABLE state_records ADD COLUMN version BIGINT NOT NULL DEFAULT 1 AFTER data;
+
+ALTER TABLE state_records MODIFY data LONGTEXT NULL;
+
+CREATE INDEX idx_state_records_seq ON state_records (seq);
+
+CREATE TABLE IF NOT EXISTS state_sequence (
+    id TINYINT PRIMARY KEY,
+    seq BIGINT NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+INSERT IGNORE INTO state_sequence (id, seq) SELECT 1, COALESCE(MAX(seq), 0) FROM state_records;
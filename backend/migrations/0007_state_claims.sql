@@ -0,0 +1,12 @@
+-- Values of unique store fields (user email, game code) claimed by the record
+-- holding them, so two workers cannot save the same value for different
+-- records (shared_state.SharedStateBackend)
+
+CREATE TABLE IF NOT EXISTS state_claims (
+    store VARCHAR(32) NOT NULL,
+    field VARCHAR(32) NOT NULL,
+    claimed_value VARCHAR(255) COLLATE utf8mb4_bin NOT NULL,
+    record_key VARCHAR(64) NOT NULL,
+    PRIMARY KEY (store, field, claimed_value),
+    KEY idx_state_claims_record (store, record_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,84 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+
+password_hash_queue_depth = metrics.registry.gauge(
+    "password_hash_queue_depth", "Password hash/verify calls waiting for a worker")
+password_hash_in_progress = metrics.registry.gauge(
+    "password_hash_in_progress", "Password hash/verify calls running on a worker")
+password_hash_seconds = metrics.registry.histogram(
+    "password_hash_seconds", "Time spent hashing or verifying a password", ("operation",),
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0))
+password_hash_rejected_total = metrics.registry.counter(
+    "password_hash_rejected_total", "Password calls turned away because the queue was full")
+
+
+class HasherBusy(Exception):
+    """Too many password operations are already queued"""
+
+
+class PasswordHasher:
+    """Runs passlib hashing and verification off the event loop.
+
+    bcrypt releases the GIL, so a small dedicated thread pool keeps a burst
+    of logins from stalling other requests. At most ``max_workers`` calls
+    run at once; up to ``max_queue`` more wait their turn and anything
+    beyond that is rejected with ``HasherBusy``.
+    """
+
+    def __init__(self, context, max_workers: int = 2, max_queue: int = 32):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = None
+        self._waiting = 0
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def _run(self, operation: str, func, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        if self._waiting >= self.max_queue:
+            password_hash_rejected_total.inc()
+            raise HasherBusy(f"{self._waiting} password operations already queued")
+
+        self._waiting += 1
+        password_hash_queue_depth.inc()
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+            password_hash_queue_depth.dec()
+
+        password_hash_in_progress.inc()
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            password_hash_seconds.observe(time.perf_counter() - started, operation=operation)
+            password_hash_in_progress.dec()
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run("verify", self.context.verify, password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,603 @@
+import os
+import re
+import json
+import fcntl
+import time
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+from pymysql import Error
+from pymysql.constants import ER
+
+import metrics
+from database import Database, db
+
+logger = logging.getLogger(__name__)
+
+# 'local' keeps state in this process (one worker); 'mysql' shares it between workers
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'local')
+STATE_DIR = os.environ.get('STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state'))
+
+SNAPSHOT_FILE = 'snapshot.json'
+WAL_FILE = 'wal.log'
+LOCK_FILE = 'lock'
+# A log is renamed to wal.<last seq>.log when a snapshot starts, and deleted
+# once that snapshot is safely on disk
+ROTATED_WAL_RE = re.compile(r"^wal\.(\d+)\.log$")
+
+UPSERT_STATE_SQL = """
+    INSERT INTO state_records (store, record_key, data, seq) VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE data = VALUES(data), seq = VALUES(seq), version = version + 1
+"""
+DELETE_STATE_SQL = "DELETE FROM state_records WHERE store = %s AND record_key = %s"
+
+state_wal_writes_total = metrics.registry.counter(
+    "state_wal_writes_total", "Store changes appended to the write-ahead log")
+state_flushed_records_total = metrics.registry.counter(
+    "state_flushed_records_total", "Changed records written to state_records")
+state_flush_failures_total = metrics.registry.counter(
+    "state_flush_failures_total", "Background flushes to state_records that failed and will be retried")
+state_flush_seconds = metrics.registry.histogram(
+    "state_flush_seconds", "Time spent writing one batch of changes to state_records")
+
+
+def _json_default(value: Any):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    # Record fields held as objects (e.g. Inventory) provide their own JSON form
+    if hasattr(value, 'to_json'):
+        return value.to_json()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_record(record: Any) -> str:
+    return json.dumps(record, separators=(',', ':'), default=_json_default)
+
+
+def capture_change(record: Any) -> Tuple[str, Any]:
+    """A change to log: ('record', the whole record) or ('patch', ...).
+
+    Taken on the event loop and JSON-encoded later on the log thread, so the
+    result shares no top-level container with ``record``; a nested value may
+    already show a later change, which is then logged again right after.
+    Record fields that record their own changes (Inventory, Equipment) are
+    logged in full once and then only as those changes, so an entry does not
+    grow with the field. A patch holds the other fields under "record", with
+    a null placeholder for each changed field, and the changes by field.
+    """
+    if isinstance(record, list):
+        return 'record', list(record)
+    if not isinstance(record, dict):
+        return 'record', record
+    fields = {}
+    changes = {}
+    for field, value in record.items():
+        drain = getattr(value, 'drain_changes', None)
+        field_changes = drain() if drain is not None else None
+        if field_changes is None:
+            if drain is not None:
+                # Copied in full now, so later changes can be sent on their own
+                value.track_changes()
+                value = value.to_json() if hasattr(value, 'to_json') else dict(value)
+            fields[field] = value
+        else:
+            fields[field] = None
+            changes[field] = field_changes
+    if not changes:
+        return 'record', fields
+    return 'patch', {'record': fields, 'changes': changes}
+
+
+class StateBackend(ABC):
+    """Where the in-memory stores in main.py are loaded from and saved to.
+
+    The stores stay plain in-process IndexedStores that handlers read and
+    change directly; a backend subscribes to them with ``register``, whose
+    optional ``decode`` turns a record loaded from JSON back into the form
+    the handlers use. A
+    ``shared`` backend lets several worker processes serve the same world:
+    ``refresh`` pulls in other workers' changes before a request, and the
+    changes collected by ``track_changes`` are saved by ``commit`` after it.
+    """
+
+    shared = False
+
+    @abstractmethod
+    def register(self, name: str, store, decode: Optional[Callable[[Any], Any]] = None) -> None:
+        """Load and save ``store`` under ``name``"""
+
+    @abstractmethod
+    def recover(self) -> int:
+        """Load saved state into the registered stores; returns the record count"""
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+    def track_changes(self):
+        return None
+
+    async def refresh(self) -> None:
+        pass
+
+    async def commit(self, changes) -> bool:
+        """Save one request's changes; False means another worker got there first"""
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        return {}
+
+
+class LocalStateBackend(StateBackend):
+    """Write-behind persistence for a single worker process.
+
+    Every change to a registered store is captured as it happens (a
+    shallow copy, or for an inventory the items that changed; see
+    ``capture_change``) and queued, so handlers never encode records or
+    wait on MySQL. A log thread, woken by each change, encodes the queued
+    changes and appends them to a local write-ahead log. A writer thread
+    applies the logged changes to its own copy of the records, fsyncs the
+    log, copies changed records to ``state_records`` in batches and, once
+    the log has grown or enough time has passed, writes a compact snapshot
+    and starts a fresh log.
+
+    ``recover`` loads the snapshot and replays the log written after it.
+    With no local files at all (for example a new volume) it reloads the
+    stores from ``state_records`` instead. If the database cannot be read it
+    raises without touching the stores or the directory, so the caller can
+    retry; until a recovery succeeds nothing is flushed or snapshotted.
+    """
+
+    def __init__(self, database: Database, directory: str = STATE_DIR,
+                 flush_interval: float = 1.0, batch_size: int = 500,
+                 snapshot_interval: float = 300.0, snapshot_after: int = 10000):
+        self.db = database
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_after = snapshot_after
+
+        self._stores = {}
+        self._decoders = {}
+        # The writer's own copy of every record by store and key, kept up to
+        # date from the logged changes. Snapshots and flushes encode these,
+        # never the records the handlers are changing.
+        self._records = {}
+        # Changes not yet logged: (seq, store, key, kind, captured value)
+        self._queue = []
+        # Logged changes not yet applied to _records: (store, key, kind, JSON)
+        self._entries = []
+        self._records_lock = threading.Lock()
+        # Held while appending to the log, so entries are written in seq order
+        self._log_lock = threading.Lock()
+        self._log_ready = threading.Event()
+        self._log_thread = None
+        # (store, key) -> seq of changes not yet written to state_records
+        self._dirty = {}
+        # Changes taken by a flush that is still running
+        self._in_flight = {}
+        self._seq = 0
+        self._wal = None
+        self._wal_entries = 0
+        self._loading = False
+        self._recovered = False
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._flush_failing = False
+        self._dir_lock = None
+        self._stats = {'recovered': 0, 'recovered_from': None, 'last_flush': None, 'last_snapshot': None}
+        self._last_snapshot = time.monotonic()
+
+    def register(self, name: str, store, decode: Optional[Callable[[Any], Any]] = None) -> None:
+        """Persist ``store`` (an IndexedStore) under ``name``"""
+        self._stores[name] = store
+        if decode is not None:
+            self._decoders[name] = decode
+        self._records.setdefault(name, {})
+        store.subscribe(lambda key, record: self.record(name, key, record))
+
+    @property
+    def wal_path(self) -> str:
+        return os.path.join(self.directory, WAL_FILE)
+
+    @property
+    def snapshot_path(self) -> str:
+        return os.path.join(self.directory, SNAPSHOT_FILE)
+
+    def record(self, name: str, key: str, record: Optional[Any]) -> None:
+        """Queue one change for the log; ``record`` is None when the key was deleted"""
+        if self._loading:
+            return
+        kind, value = ('record', None) if record is None else capture_change(record)
+        with self._lock:
+            self._seq += 1
+            self._queue.append((self._seq, name, key, kind, value))
+            self._dirty[(name, key)] = self._seq
+        self._log_ready.set()
+
+    def _append_queued(self) -> None:
+        """Encode the queued changes and append them to the log"""
+        with self._log_lock:
+            with self._lock:
+                queued, self._queue = self._queue, []
+            self._append(queued)
+
+    def _append(self, queued: List[tuple]) -> None:
+        # Callers hold _log_lock
+        if not queued:
+            return
+        lines = []
+        entries = []
+        for seq, name, key, kind, value in queued:
+            try:
+                text = None if value is None else encode_record(value)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Could not log a change to {name}/{key}: {e}")
+                continue
+            lines.append(f'{{"seq":{seq},"store":{json.dumps(name)},"key":{json.dumps(key)},"{kind}":{text or "null"}}}\n')
+            entries.append((name, key, kind, text))
+        with self._lock:
+            wal = self._wal
+            self._entries.extend(entries)
+            self._wal_entries += len(entries)
+        if wal is not None:
+            try:
+                wal.write(''.join(lines).encode('utf-8'))
+            except OSError as e:
+                # The changes still reach state_records with the next flush
+                logger.error(f"Could not append to the state log: {e}")
+        state_wal_writes_total.inc(len(entries))
+
+    def _decode(self, name: str, record: Any) -> Any:
+        decode = self._decoders.get(name)
+        return decode(record) if decode is not None else record
+
+    def _apply(self, records: Dict[str, Dict[str, Any]], name: str, key: str, kind: str, value: Any) -> None:
+        """Apply one logged change (already parsed from JSON) to ``records``"""
+        store_records = records.setdefault(name, {})
+        if value is None:
+            store_records.pop(key, None)
+        elif kind == 'record':
+            store_records[key] = self._decode(name, value)
+        else:
+            current = store_records.get(key)
+            if current is None:
+                logger.error(f"Ignoring a change to {name}/{key}, which has no saved record")
+                return
+            # Fields logged in full are decoded as usual; the placeholders of
+            # the changed fields are replaced by the updated current values
+            record = self._decode(name, value['record'])
+            for field, changes in value['changes'].items():
+                current[field].apply_changes(changes)
+                record[field] = current[field]
+            store_records[key] = record
+
+    def _catch_up(self) -> None:
+        """Apply the changes logged so far to the writer's copy of the records"""
+        with self._lock:
+            entries, self._entries = self._entries, []
+        for name, key, kind, text in entries:
+            self._apply(self._records, name, key, kind, None if text is None else json.loads(text))
+
+    # --- recovery ---
+
+    def recover(self) -> int:
+        """Load saved state into the registered stores and open a fresh log.
+
+        Returns the number of records restored.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_directory()
+        # Decoded records by store and key, which become the writer's copy
+        state = {name: {} for name in self._stores}
+        # Changes that may not have reached state_records before shutdown
+        unflushed = {}
+        snapshot_seq = self._read_snapshot(state, unflushed)
+        seq = self._replay_logs(state, snapshot_seq, unflushed)
+        source = 'local'
+        if not os.path.exists(self.snapshot_path) and seq == 0:
+            seq = self._read_database(state)
+            source = 'database'
+
+        restored = 0
+        with self._lock:
+            self._seq = seq
+            self._dirty = {item: item_seq for item, item_seq in unflushed.items() if item[0] in self._stores}
+            self._queue = []
+            self._entries = []
+            self._loading = True
+            try:
+                for name, store in self._stores.items():
+                    records = self._records[name] = state.get(name, {})
+                    for key, record in records.items():
+                        # The handlers get their own copy of each record
+                        store[key] = self._decode(name, json.loads(encode_record(record)))
+                        restored += 1
+            finally:
+                self._loading = False
+
+        self._stats['recovered'] = restored
+        self._stats['recovered_from'] = source if restored else None
+        logger.info(f"Recovered {restored} state records from {source} state (seq {seq})")
+        # Compact right away so the next boot has no log to replay
+        self.snapshot()
+        self._recovered = True
+        return restored
+
+    def _lock_directory(self) -> None:
+        # Two processes appending to one log would corrupt it
+        if self._dir_lock is not None:
+            return
+        lock_file = open(os.path.join(self.directory, LOCK_FILE), 'w')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise RuntimeError(f"{self.directory} is in use by another process; "
+                               f"run a single worker or set STATE_BACKEND=mysql")
+        self._dir_lock = lock_file
+
+    def _read_snapshot(self, state: Dict[str, Dict[str, Any]], unflushed: Dict[tuple, int]) -> int:
+        if not os.path.exists(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+        for name, records in snapshot['stores'].items():
+            state.setdefault(name, {}).update((key, self._decode(name, record)) for key, record in records.items())
+        for name, key, seq in snapshot.get('unflushed', ()):
+            unflushed[(name, key)] = seq
+        return snapshot['seq']
+
+    def _log_files(self) -> List[str]:
+        rotated = []
+        for filename in os.listdir(self.directory):
+            match = ROTATED_WAL_RE.match(filename)
+            if match:
+                rotated.append((int(match.group(1)), filename))
+        files = [os.path.join(self.directory, filename) for _, filename in sorted(rotated)]
+        if os.path.exists(self.wal_path):
+            files.append(self.wal_path)
+        return files
+
+    def _replay_logs(self, state: Dict[str, Dict[str, Any]], after_seq: int, unflushed: Dict[tuple, int]) -> int:
+        seq = after_seq
+        for path in self._log_files():
+            with open(path, 'r', encoding='utf-8') as f:
+                for number, line in enumerate(f, 1):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A write cut short by a crash; nothing after it was acknowledged
+                        logger.warning(f"Ignoring unreadable entry at {os.path.basename(path)}:{number}")
+                        break
+                    if entry['seq'] <= after_seq:
+                        continue
+                    kind = 'patch' if 'patch' in entry else 'record'
+                    self._apply(state, entry['store'], entry['key'], kind, entry[kind])
+                    unflushed[(entry['store'], entry['key'])] = entry['seq']
+                    seq = max(seq, entry['seq'])
+        return seq
+
+    def _read_database(self, state: Dict[str, Dict[str, Any]]) -> int:
+        # Starting empty here would write an empty snapshot, and later boots
+        # would never look at state_records again
+        if not self.db.connect():
+            raise RuntimeError("No local state and the database holding the saved state is unreachable")
+        try:
+            rows = self.db.execute_query(
+                "SELECT store, record_key, data, seq FROM state_records WHERE data IS NOT NULL ORDER BY seq")
+        except Error as e:
+            if e.args and e.args[0] == ER.NO_SUCH_TABLE:
+                # A new installation: nothing has ever been saved
+                return 0
+            raise RuntimeError(f"No local state and the saved state could not be read: {e}") from e
+        seq = 0
+        for row in rows:
+            state.setdefault(row['store'], {})[row['record_key']] = self._decode(row['store'], json.loads(row['data']))
+            seq = max(seq, row['seq'])
+        return seq
+
+    # --- background work ---
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._log_thread = threading.Thread(target=self._run_log, name="state-log", daemon=True)
+        self._log_thread.start()
+        self._thread = threading.Thread(target=self._run, name="state-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the log and writer threads after a final flush and snapshot"""
+        self._stop.set()
+        self._log_ready.set()
+        for thread in (self._log_thread, self._thread):
+            if thread is not None:
+                thread.join(timeout=10)
+        self._log_thread = self._thread = None
+        # Without a recovery the writer's copy is empty and must not replace
+        # the saved state
+        if self._recovered:
+            self._flush_quietly()
+            self.snapshot()
+        with self._log_lock, self._lock:
+            if self._wal is not None:
+                self._wal.close()
+                self._wal = None
+        if self._dir_lock is not None:
+            self._dir_lock.close()
+            self._dir_lock = None
+
+    def _run_log(self) -> None:
+        while not self._stop.is_set():
+            self._log_ready.wait(self.flush_interval)
+            self._log_ready.clear()
+            try:
+                self._append_queued()
+            except Exception:
+                logger.exception("State log append failed")
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.sync()
+                self._flush_quietly()
+                due = time.monotonic() - self._last_snapshot >= self.snapshot_interval
+                if self._wal_entries >= self.snapshot_after or (due and self._wal_entries):
+                    self.snapshot()
+            except Exception:
+                logger.exception("State writer iteration failed")
+
+    def sync(self) -> None:
+        """fsync the log so acknowledged changes survive a machine crash"""
+        with self._lock:
+            wal = self._wal
+            fileno = wal.fileno() if wal is not None else None
+        if fileno is not None:
+            os.fsync(fileno)
+
+    def _flush_quietly(self) -> None:
+        try:
+            self.flush()
+            if self._flush_failing:
+                logger.info("State flushes to the database are succeeding again")
+            self._flush_failing = False
+        except Error as e:
+            state_flush_failures_total.inc()
+            # Log once per outage; the log on disk keeps the changes meanwhile
+            if not self._flush_failing:
+                logger.warning(f"Could not flush state to the database, will retry: {e}")
+            self._flush_failing = True
+
+    def flush(self) -> int:
+        """Write changed records to state_records; returns how many were written"""
+        with self._records_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+                pending, self._dirty = self._dirty, {}
+                self._in_flight = pending
+            # Every change in pending is logged by this append
+            self._append_queued()
+            self._catch_up()
+            batch = []
+            for (name, key), seq in pending.items():
+                record = self._records.get(name, {}).get(key)
+                batch.append((name, key, None if record is None else encode_record(record), seq))
+
+        written = 0
+        try:
+            for start in range(0, len(batch), self.batch_size):
+                chunk = batch[start:start + self.batch_size]
+                upserts = [(name, key, text, seq) for name, key, text, seq in chunk if text is not None]
+                deletes = [(name, key) for name, key, text, _ in chunk if text is None]
+                started = time.perf_counter()
+                with self.db.get_cursor() as cursor:
+                    if upserts:
+                        cursor.executemany(UPSERT_STATE_SQL, upserts)
+                    if deletes:
+                        cursor.executemany(DELETE_STATE_SQL, deletes)
+                state_flush_seconds.observe(time.perf_counter() - started)
+                written += len(chunk)
+        except Error:
+            # Requeue what was not written, unless a newer change is already queued
+            with self._lock:
+                for name, key, _, seq in batch[written:]:
+                    self._dirty.setdefault((name, key), seq)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight = {}
+            state_flushed_records_total.inc(written)
+
+        self._stats['last_flush'] = time.time()
+        return written
+
+    def snapshot(self) -> None:
+        """Write every record to a new snapshot and start a fresh log"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._records_lock, self._log_lock:
+            # Log what is queued without holding up handlers, then whatever
+            # was queued meanwhile, so the old log ends exactly at seq
+            with self._lock:
+                queued, self._queue = self._queue, []
+            self._append(queued)
+            with self._lock:
+                seq = self._seq
+                queued, self._queue = self._queue, []
+            self._append(queued)
+            with self._lock:
+                entries, self._entries = self._entries, []
+                unflushed = {item: item_seq for item, item_seq in {**self._in_flight, **self._dirty}.items()
+                             if item_seq <= seq}
+                if self._wal is not None:
+                    self._wal.close()
+                if os.path.exists(self.wal_path):
+                    os.replace(self.wal_path, os.path.join(self.directory, f"wal.{seq}.log"))
+                self._wal = open(self.wal_path, 'ab', buffering=0)
+                self._wal_entries = 0
+            # Bring the copy to exactly seq; later changes stay queued
+            for name, key, kind, text in entries:
+                self._apply(self._records, name, key, kind, None if text is None else json.loads(text))
+
+            temporary = self.snapshot_path + '.tmp'
+            with open(temporary, 'w', encoding='utf-8') as f:
+                f.write(f'{{"seq":{seq},"stores":{{')
+                for i, (name, items) in enumerate(self._records.items()):
+                    body = ','.join(f'{json.dumps(key)}:{encode_record(record)}' for key, record in items.items())
+                    f.write(f'{"," if i else ""}{json.dumps(name)}:{{{body}}}')
+                f.write('},"unflushed":')
+                f.write(json.dumps([[name, key, item_seq] for (name, key), item_seq in unflushed.items()]))
+                f.write('}\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.snapshot_path)
+
+        # The snapshot now covers everything in the rotated logs
+        for path in self._log_files():
+            match = ROTATED_WAL_RE.match(os.path.basename(path))
+            if match and int(match.group(1)) <= seq:
+                os.remove(path)
+        self._last_snapshot = time.monotonic()
+        self._stats['last_snapshot'] = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = len(self._dirty)
+            queued = len(self._queue)
+            records = {name: len(items) for name, items in self._records.items()}
+        return {
+            'backend': 'local',
+            **self._stats,
+            'seq': self._seq,
+            'records': records,
+            'queued_for_log': queued,
+            'log_entries_since_snapshot': self._wal_entries,
+            'pending_flush': pending,
+            'flush_failing': self._flush_failing,
+        }
+
+
+def create_state_backend(kind: str = STATE_BACKEND, database: Database = db) -> StateBackend:
+    if kind == 'local':
+        return LocalStateBackend(database)
+    if kind == 'mysql':
+        # Imported here because shared_state builds on this module
+        from shared_state import SharedStateBackend
+        return SharedStateBackend(database)
+    raise ValueError(f"Unknown STATE_BACKEND {kind!r}; expected 'local' or 'mysql'")
+
+
+state_backend = create_state_backend()
+
+metrics.registry.callback_gauge(
+    "state_pending_flush", "Changed records waiting to be written to state_records", (),
+    lambda: {(): state_backend.status().get('pending_flush', 0)})
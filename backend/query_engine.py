@@ -0,0 +1,277 @@
+import re
+import json
+import time
+import logging
+import threading
+import itertools
+from collections import OrderedDict
+from decimal import Decimal
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+
+from pymysql import Error
+
+from database import Database, db, PRIVATE_TABLES
+
+logger = logging.getLogger(__name__)
+
+# MySQL error raised when a statement hits its MAX_EXECUTION_TIME
+MAX_EXECUTION_TIME_EXCEEDED = 3024
+
+# String literals, quoted identifiers and comments, in the order MySQL reads them.
+# "--" only starts a comment when whitespace follows ("1--1" is 1 - (-1)).
+SQL_TOKEN_RE = re.compile(
+    r"""'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`"""
+    r"""|(?P<comment>--(?=\s)[^\n]*|\#[^\n]*|/\*.*?\*/)"""
+    r"""|(?P<space>\s+)|(?P<semicolon>;)""",
+    re.DOTALL
+)
+
+# Statements with side effects that can still start with SELECT
+FORBIDDEN_SELECT_RE = re.compile(r"\bINTO\s+(OUTFILE|DUMPFILE|@)|\bFOR\s+(UPDATE|SHARE)\b|\bLOCK\s+IN\s+SHARE\s+MODE\b",
+                                 re.IGNORECASE)
+PRIVATE_TABLE_RE = re.compile(r"\b(" + "|".join(PRIVATE_TABLES) + r")\b", re.IGNORECASE)
+
+
+class QueryRejected(ValueError):
+    """The SQL text is not a single read-only SELECT"""
+
+
+class QueryTimeout(Error):
+    """The query ran longer than the engine's execution time limit"""
+
+
+def normalize_sql(sql: str) -> str:
+    """Strip comments and a trailing semicolon and collapse whitespace outside literals.
+
+    Two queries that differ only in formatting normalize to the same text,
+    which is what the result cache is keyed on.
+    """
+    parts = []
+    position = 0
+    statements = 1
+    for match in SQL_TOKEN_RE.finditer(sql):
+        if match.start() > position:
+            parts.append(sql[position:match.start()])
+        position = match.end()
+        if match.group('comment') is not None or match.group('space') is not None:
+            if not parts or parts[-1] != ' ':
+                parts.append(' ')
+        elif match.group('semicolon') is not None:
+            parts.append(';')
+            statements += 1
+        else:
+            parts.append(match.group(0))
+    parts.append(sql[position:])
+
+    normalized = "".join(parts).strip()
+    while normalized.endswith(';'):
+        normalized = normalized[:-1].rstrip()
+        statements -= 1
+    if statements > 1:
+        raise QueryRejected("Only a single statement is allowed")
+    return normalized
+
+
+def encode_row(row: Dict[str, Any]) -> str:
+    return json.dumps(row, ensure_ascii=False, default=_json_default)
+
+
+def _json_default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+class QueryResult:
+    """Rows of one query as JSON text, read lazily up to the engine's caps.
+
+    Iterating yields encoded rows. Once iteration ends, ``truncated`` tells
+    whether the row or byte cap cut the result short and ``error`` holds a
+    failure that happened after the first batch had already been sent.
+    """
+
+    def __init__(self, engine: 'QueryEngine', key: tuple, max_rows: int,
+                 batches: Iterator[List[Dict[str, Any]]] = None,
+                 source: Iterator = None, version: int = None,
+                 rows: Tuple[str, ...] = None, truncated: bool = False):
+        self.engine = engine
+        self.key = key
+        self.max_rows = max_rows
+        self.version = version
+        self.cached = rows is not None
+        self.truncated = truncated
+        self.count = 0
+        self.bytes = 0
+        self.error = None
+        self._batches = batches
+        self._source = source
+        self._rows = rows
+
+    def __iter__(self) -> Iterator[str]:
+        if self.cached:
+            for text in self._rows:
+                self.count += 1
+                self.bytes += len(text.encode('utf-8'))
+                yield text
+            return
+
+        collected = []
+        try:
+            for batch in self._batches:
+                for row in batch:
+                    text = encode_row(row)
+                    size = len(text.encode('utf-8'))
+                    if self.count >= self.max_rows or self.bytes + size > self.engine.max_bytes:
+                        self.truncated = True
+                        break
+                    self.count += 1
+                    self.bytes += size
+                    collected.append(text)
+                    yield text
+                if self.truncated:
+                    break
+        except Error as e:
+            self.error = self.engine.describe_error(e)
+            logger.warning(f"Custom query failed while streaming: {self.error}")
+        finally:
+            # Stops the server-side cursor when a cap was hit or the client went away
+            self._source.close()
+
+        if self.error is None:
+            self.engine.store(self.key, self.version, tuple(collected), self.truncated, self.bytes)
+
+
+class QueryEngine:
+    """Guarded execution of ad-hoc read-only queries.
+
+    Every statement gets a ``MAX_EXECUTION_TIME`` optimizer hint and is read
+    through an unbuffered cursor, stopping at ``max_rows`` rows or
+    ``max_bytes`` of encoded JSON. Complete results are cached by normalized
+    SQL for ``cache_ttl`` seconds, or until any table data changes, keeping
+    at most ``cache_bytes`` of row text in total.
+    """
+
+    def __init__(self, database: Database,
+                 max_execution_ms: int = 5000,
+                 max_rows: int = 5000,
+                 max_bytes: int = 4 * 1024 * 1024,
+                 batch_size: int = 500,
+                 cache_ttl: float = 30.0,
+                 cache_bytes: int = 32 * 1024 * 1024):
+        self.db = database
+        self.max_execution_ms = max_execution_ms
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.cache_ttl = cache_ttl
+        self.cache_bytes = cache_bytes
+
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'timeouts': 0, 'truncated': 0}
+
+    def prepare(self, sql: str) -> str:
+        """Validate and normalize a query; raises QueryRejected"""
+        normalized = normalize_sql(sql)
+        if not normalized.upper().startswith("SELECT"):
+            raise QueryRejected("Only SELECT queries are allowed")
+        if FORBIDDEN_SELECT_RE.search(normalized):
+            raise QueryRejected("SELECT ... INTO and locking reads are not allowed")
+        private = PRIVATE_TABLE_RE.search(normalized)
+        if private:
+            raise QueryRejected(f"Table {private.group(1)} cannot be queried")
+        return normalized
+
+    def with_time_limit(self, sql: str) -> str:
+        # Optimizer hints must directly follow the SELECT keyword
+        return f"SELECT /*+ MAX_EXECUTION_TIME({self.max_execution_ms}) */{sql[6:]}"
+
+    def describe_error(self, error: Error) -> str:
+        if error.args and error.args[0] == MAX_EXECUTION_TIME_EXCEEDED:
+            return f"Query exceeded the {self.max_execution_ms} ms time limit"
+        return str(error)
+
+    def explain(self, sql: str) -> Dict[str, Any]:
+        """Return the optimizer's plan for a prepared query without running it"""
+        plan = self.db.execute_query(f"EXPLAIN {sql}")
+        estimated_rows = 1
+        for step in plan:
+            estimated_rows *= max(int(step.get('rows') or 1), 1)
+        return {"plan": plan, "estimated_rows": estimated_rows}
+
+    def execute(self, sql: str, max_rows: int = None) -> QueryResult:
+        """Start a prepared query and read its first batch.
+
+        Errors the server reports up front (syntax, missing tables, the time
+        limit) are raised here, before any response has been sent.
+        """
+        max_rows = min(max_rows or self.max_rows, self.max_rows)
+        key = (sql, max_rows)
+        version = self.db.data_version
+
+        cached = self.lookup(key, version)
+        if cached is not None:
+            rows, truncated = cached
+            return QueryResult(self, key, max_rows, rows=rows, truncated=truncated)
+
+        source = self.db.stream_query(self.with_time_limit(sql), batch_size=min(self.batch_size, max_rows + 1))
+        try:
+            first = next(source, [])
+        except Error as e:
+            if e.args and e.args[0] == MAX_EXECUTION_TIME_EXCEEDED:
+                with self._lock:
+                    self._stats['timeouts'] += 1
+                raise QueryTimeout(self.describe_error(e))
+            raise
+        batches = itertools.chain([first], source)
+        return QueryResult(self, key, max_rows, batches=batches, source=source, version=version)
+
+    def lookup(self, key: tuple, version: int) -> Optional[Tuple[Tuple[str, ...], bool]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                expires_at, entry_version, rows, truncated, size = entry
+                if expires_at > time.monotonic() and entry_version == version:
+                    self._cache.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return rows, truncated
+                self._evict(key)
+            self._stats['misses'] += 1
+            return None
+
+    def store(self, key: tuple, version: int, rows: Tuple[str, ...], truncated: bool, size: int) -> None:
+        """Cache a complete result; ``size`` is its encoded length in bytes"""
+        with self._lock:
+            if truncated:
+                self._stats['truncated'] += 1
+            if self.cache_ttl <= 0 or version != self.db.data_version or size > self.cache_bytes:
+                return
+            if key in self._cache:
+                self._evict(key)
+            self._cache[key] = (time.monotonic() + self.cache_ttl, version, rows, truncated, size)
+            self._cached_bytes += size
+            while self._cached_bytes > self.cache_bytes:
+                self._evict(next(iter(self._cache)))
+
+    def _evict(self, key: tuple) -> None:
+        self._cached_bytes -= self._cache.pop(key)[4]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._cached_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached_queries'] = len(self._cache)
+            stats['cached_bytes'] = self._cached_bytes
+        return stats
+
+
+query_engine = QueryEngine(db)
@@ -0,0 +1,157 @@
+import os
+import re
+import time
+import hashlib
+import logging
+from typing import List, Dict, NamedTuple
+
+from pymysql import Error
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_FILE_RE = re.compile(r"^(\d+)_([A-Za-z0-9_]+)\.sql$")
+
+# Errors that mean a statement already took effect on an earlier, interrupted
+# run (DDL auto-commits, so a migration can be partially applied)
+IGNORABLE_DDL_ERRORS = {
+    1050: "table already exists",
+    1060: "duplicate column",
+    1061: "duplicate key name",
+    1091: "column or key does not exist",
+}
+
+# Serializes migrations between app processes starting at the same time
+MIGRATION_LOCK = 'ttrpg_schema_migrations'
+
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INT PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        execution_ms INT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    statements: List[str]
+    checksum: str
+
+
+class MigrationError(Error):
+    """A migration statement failed; the schema is left at the previous version"""
+
+
+def split_statements(sql: str) -> List[str]:
+    """Split a migration file into statements at semicolons that end a line.
+
+    Full-line ``--`` comments are dropped. Migrations must not put a
+    semicolon at the end of a line inside a string literal.
+    """
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    statements = re.split(r";[ \t]*(?:\n|$)", "\n".join(lines))
+    return [statement.strip() for statement in statements if statement.strip()]
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE_RE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+            sql = f.read()
+        migrations.append(Migration(
+            version=int(match.group(1)),
+            name=match.group(2),
+            statements=split_statements(sql),
+            checksum=hashlib.sha256(sql.encode('utf-8')).hexdigest(),
+        ))
+    migrations.sort(key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+class MigrationRunner:
+    """Applies the numbered ``.sql`` files in ``migrations/`` in order.
+
+    Applied versions are recorded in ``schema_version``. When the database is
+    already at the latest version, ``run`` costs a single query.
+    """
+
+    def __init__(self, database, directory: str = MIGRATIONS_DIR, lock_timeout: int = 60):
+        self.db = database
+        self.directory = directory
+        self.lock_timeout = lock_timeout
+
+    def current_version(self) -> int:
+        if 'schema_version' not in self.db.get_schema():
+            return 0
+        rows = self.db.execute_query("SELECT MAX(version) AS version FROM schema_version")
+        return (rows[0]['version'] or 0) if rows else 0
+
+    def status(self) -> Dict[str, int]:
+        migrations = load_migrations(self.directory)
+        return {
+            'current': self.current_version(),
+            'latest': migrations[-1].version if migrations else 0,
+        }
+
+    def run(self) -> List[int]:
+        """Apply pending migrations and return the versions that were applied"""
+        migrations = load_migrations(self.directory)
+        if not migrations or self.current_version() >= migrations[-1].version:
+            return []
+
+        applied_now = []
+        with self.db.get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT GET_LOCK(%s, %s) AS locked", (MIGRATION_LOCK, self.lock_timeout))
+                if not cursor.fetchone()['locked']:
+                    raise MigrationError("Timed out waiting for another process to finish migrating")
+                try:
+                    cursor.execute(SCHEMA_VERSION_DDL)
+                    # Another process may have migrated while this one waited for the lock
+                    cursor.execute("SELECT version, checksum FROM schema_version")
+                    applied = {row['version']: row['checksum'] for row in cursor.fetchall()}
+
+                    for migration in migrations:
+                        if migration.version in applied:
+                            if applied[migration.version] != migration.checksum:
+                                logger.warning(f"Migration {migration.version}_{migration.name} "
+                                               f"changed after it was applied")
+                            continue
+                        self._apply(conn, cursor, migration)
+                        applied_now.append(migration.version)
+                finally:
+                    cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+        return applied_now
+
+    def _apply(self, conn, cursor, migration: Migration) -> None:
+        logger.info(f"Applying migration {migration.version}_{migration.name}")
+        started = time.perf_counter()
+        for statement in migration.statements:
+            try:
+                cursor.execute(statement)
+            except Error as e:
+                code = e.args[0] if e.args else None
+                if code in IGNORABLE_DDL_ERRORS:
+                    logger.info(f"Skipping statement in {migration.version}_{migration.name}: "
+                                f"{IGNORABLE_DDL_ERRORS[code]}")
+                    continue
+                conn.rollback()
+                raise MigrationError(f"Migration {migration.version}_{migration.name} failed: {e}") from e
+
+        elapsed_ms = int((time.perf_counter() - started) * 1000)
+        cursor.execute(
+            "INSERT INTO schema_version (version, name, checksum, execution_ms) VALUES (%s, %s, %s, %s)",
+            (migration.version, migration.name, migration.checksum, elapsed_ms)
+        )
+        conn.commit()
+        logger.info(f"Applied migration {migration.version}_{migration.name} in {elapsed_ms} ms")
@@ -0,0 +1,264 @@
+import math
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from typing import List, Dict, Any, Tuple, Iterable, Optional
+
+# Catalog text columns and how much a match in each one counts
+TEXT_FIELD_WEIGHTS = {
+    'name': 4.0,
+    'abilities': 1.5,
+    'property': 1.5,
+    'special': 1.2,
+    'bonus': 1.2,
+    'behavior': 1.0,
+    'description': 1.0,
+}
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Query terms at least this long also match longer words that start with them,
+# which covers Ukrainian inflections ("собак" -> "собака", "собаки")
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_EXPANSIONS = 64
+PREFIX_MATCH_FACTOR = 0.6
+
+
+def tokenize(text: Any) -> List[str]:
+    if text is None:
+        return []
+    return TOKEN_RE.findall(str(text).casefold())
+
+
+class FullTextIndex:
+    """Field-weighted inverted index over the text columns of one table.
+
+    Documents are row positions of a ``TableSnapshot``. Scoring is BM25 over
+    a weighted term frequency (matches in ``name`` count more than matches
+    in ``description``), and documents matching more distinct query terms
+    always rank ahead of documents matching fewer.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, columns: Iterable[str], rows: Iterable[Tuple[Any, ...]],
+                 field_weights: Dict[str, float] = None):
+        field_weights = field_weights or TEXT_FIELD_WEIGHTS
+        columns = list(columns)
+        self.fields = [(pos, col, field_weights[col]) for pos, col in enumerate(columns) if col in field_weights]
+
+        postings = defaultdict(dict)  # term -> {doc: (weighted tf, fields)}
+        lengths = []
+        for doc, row in enumerate(rows):
+            length = 0.0
+            for pos, col, weight in self.fields:
+                tokens = tokenize(row[pos])
+                length += weight * len(tokens)
+                for token in tokens:
+                    tf, fields = postings[token].get(doc, (0.0, frozenset()))
+                    postings[token][doc] = (tf + weight, fields | {col})
+            lengths.append(length)
+
+        self.doc_count = len(lengths)
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / self.doc_count) if self.doc_count else 0.0
+        self.postings = dict(postings)
+        self.vocabulary = sorted(self.postings)
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        """Exact match plus vocabulary words starting with the term"""
+        matches = [(term, 1.0)] if term in self.postings else []
+        if len(term) < MIN_PREFIX_LENGTH:
+            return matches
+        start = bisect_left(self.vocabulary, term)
+        for word in self.vocabulary[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+            if not word.startswith(term):
+                break
+            if word != term:
+                matches.append((word, PREFIX_MATCH_FACTOR))
+        return matches
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings[term])
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: Optional[int] = 20) -> List[Tuple[int, float, List[str]]]:
+        """Return (row position, score, matched fields) ordered by relevance"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self.doc_count:
+            return []
+
+        scores = defaultdict(float)
+        coverage = defaultdict(int)
+        matched_fields = defaultdict(set)
+        for term in terms:
+            best = {}
+            for word, factor in self._expand(term):
+                idf = self._idf(word)
+                for doc, (tf, fields) in self.postings[word].items():
+                    norm = self.K1 * (1 - self.B + self.B * self.lengths[doc] / self.avg_length)
+                    score = factor * idf * tf * (self.K1 + 1) / (tf + norm)
+                    if score > best.get(doc, 0.0):
+                        best[doc] = score
+                    matched_fields[doc].update(fields)
+            for doc, score in best.items():
+                scores[doc] += score
+                coverage[doc] += 1
+
+        ranked = sorted(scores, key=lambda doc: (-coverage[doc], -scores[doc], doc))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [(doc, round(scores[doc], 4), sorted(matched_fields[doc])) for doc in ranked]
+
+
+# --- Fuzzy matching for Cyrillic/Latin mixed content ---
+
+# Cyrillic letters that look like Latin ones; folded where they were typed
+# in place of Latin, e.g. the Cyrillic "х" in "5.45х39" or the "М" in "AKМ"
+HOMOGLYPHS = str.maketrans({
+    'а': 'a', 'в': 'b', 'е': 'e', 'і': 'i', 'к': 'k', 'м': 'm', 'н': 'h',
+    'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'ј': 'j',
+    'ѕ': 's', 'ԁ': 'd',
+})
+
+# Ukrainian national transliteration (position-independent simplification),
+# plus the Russian-only letters that show up in player input
+TRANSLITERATION = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'h', 'ґ': 'g', 'д': 'd', 'е': 'e',
+    'є': 'ie', 'ж': 'zh', 'з': 'z', 'и': 'y', 'і': 'i', 'ї': 'i', 'й': 'i',
+    'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch',
+    'ш': 'sh', 'щ': 'shch', 'ь': '', 'ю': 'iu', 'я': 'ia',
+    'ё': 'e', 'ъ': '', 'ы': 'y', 'э': 'e',
+})
+
+CYRILLIC_RUN_RE = re.compile(r"[\u0400-\u04ff]+")
+LATIN_RE = re.compile(r"[a-z]")
+DIGIT_RE = re.compile(r"[0-9]")
+APOSTROPHES_RE = re.compile(r"['’ʼ`]")
+NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+# Spelling variants players use for the same Cyrillic letter (г/х as g/h/kh,
+# и/й as y/i/j, ц as ts/c), collapsed only for fuzzy matching
+LOOSE_FOLDS = [
+    (re.compile(r"kh"), 'h'),
+    (re.compile(r"(?<![zsc])h"), 'g'),
+    (re.compile(r"[yj]"), 'i'),
+    (re.compile(r"ts"), 'c'),
+]
+
+
+def _fold_homoglyphs(match: re.Match) -> str:
+    # A Cyrillic run stands in for Latin when it touches a Latin letter
+    # ("akм") or is a single letter between digits ("9х18"); a word that
+    # merely sits next to a number ("форт-17", "ан-94") is transliterated
+    run, text = match.group(), match.string
+    start, end = match.span()
+    before = text[start - 1] if start > 0 else ''
+    after = text[end] if end < len(text) else ''
+    if LATIN_RE.match(before) or LATIN_RE.match(after):
+        return run.translate(HOMOGLYPHS)
+    if len(run) == 1 and DIGIT_RE.match(before) and DIGIT_RE.match(after):
+        return run.translate(HOMOGLYPHS)
+    return run
+
+
+def normalize_text(text: Any) -> str:
+    """Fold text to a Latin, lower-case, punctuation-free search key.
+
+    Case folding, then homoglyph folding for Cyrillic letters typed in
+    place of Latin ones, then transliteration of the remaining Cyrillic.
+    "АКМ-74" -> "akm 74", "Форт-17" -> "fort 17",
+    "Сліпа собака" -> "slipa sobaka", "5.45х39" and "5.45x39" -> "5 45x39".
+    """
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKC', str(text)).casefold()
+    text = APOSTROPHES_RE.sub('', text).replace('×', 'x')
+    text = CYRILLIC_RUN_RE.sub(_fold_homoglyphs, text).translate(TRANSLITERATION)
+    return NON_ALNUM_RE.sub(' ', text).strip()
+
+
+def loose_key(normalized: str) -> str:
+    for pattern, replacement in LOOSE_FOLDS:
+        normalized = pattern.sub(replacement, normalized)
+    return normalized
+
+
+def word_trigrams(normalized: str) -> set:
+    """pg_trgm style trigrams: each word padded with two leading and one trailing space"""
+    grams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def raw_trigrams(normalized: str) -> set:
+    return {normalized[i:i + 3] for i in range(len(normalized) - 2)}
+
+
+class TrigramIndex:
+    """Trigram index over one column's normalized values.
+
+    ``contains`` answers normalized substring queries, using raw trigrams
+    to prefilter candidates. ``fuzzy`` ranks rows by trigram word
+    similarity, so typos and transliteration variants still match.
+    """
+
+    def __init__(self, values: Iterable[Any]):
+        self.values = [normalize_text(value) for value in values]
+        self.word_grams = []
+        self.fuzzy_postings = {}
+        self.raw_postings = {}
+        for doc, value in enumerate(self.values):
+            grams = word_trigrams(loose_key(value))
+            self.word_grams.append(len(grams))
+            for gram in grams:
+                self.fuzzy_postings.setdefault(gram, []).append(doc)
+            for gram in raw_trigrams(value):
+                self.raw_postings.setdefault(gram, []).append(doc)
+
+    def contains(self, term: str) -> List[int]:
+        needle = normalize_text(term)
+        if not needle:
+            return []
+        grams = raw_trigrams(needle)
+        if grams:
+            postings = sorted((self.raw_postings.get(gram, ()) for gram in grams), key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                candidates.intersection_update(posting)
+                if not candidates:
+                    return []
+            candidates = sorted(candidates)
+        else:
+            candidates = range(len(self.values))
+        return [doc for doc in candidates if needle in self.values[doc]]
+
+    def fuzzy(self, term: str, threshold: float = 0.3, limit: Optional[int] = 50) -> List[Tuple[int, float]]:
+        """Return (row position, similarity) for rows above ``threshold``, best first"""
+        query_grams = word_trigrams(loose_key(normalize_text(term)))
+        if not query_grams:
+            return []
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for doc in self.fuzzy_postings.get(gram, ()):
+                shared[doc] += 1
+
+        scored = []
+        for doc, common in shared.items():
+            # Word similarity: how much of the query appears in the value,
+            # with full-string Jaccard similarity as the tie breaker
+            word_similarity = common / len(query_grams)
+            if word_similarity < threshold:
+                continue
+            similarity = common / (len(query_grams) + self.word_grams[doc] - common)
+            scored.append((doc, round(word_similarity, 4), similarity))
+
+        scored.sort(key=lambda item: (-item[1], -item[2], item[0]))
+        if limit is not None:
+            scored = scored[:limit]
+        return [(doc, score) for doc, score, _ in scored]
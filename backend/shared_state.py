@@ -0,0 +1,365 @@
+import json
+import time
+import logging
+import contextvars
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+from pymysql import IntegrityError
+
+import metrics
+from database import Database
+from async_database import AsyncDatabase, async_db
+from persistence import StateBackend, encode_record
+from stores import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Taking the next sequence number locks the counter row until commit, so
+# sequence order is commit order and a reader never skips a late commit
+NEXT_SEQ_SQL = "UPDATE state_sequence SET seq = LAST_INSERT_ID(seq + 1) WHERE id = 1"
+INSERT_RECORD_SQL = """
+    INSERT INTO state_records (store, record_key, data, version, seq) VALUES (%s, %s, %s, 1, %s)
+"""
+UPDATE_RECORD_SQL = """
+    UPDATE state_records SET data = %s, version = version + 1, seq = %s
+    WHERE store = %s AND record_key = %s AND version = %s
+"""
+SELECT_RECORDS_SQL = "SELECT store, record_key, data, version, seq FROM state_records"
+# Unique field values (email, game code) are claimed in the same transaction
+# as the record, so two workers cannot both save a value
+RELEASE_CLAIMS_SQL = """
+    DELETE FROM state_claims WHERE store = %s AND field = %s AND record_key = %s AND claimed_value <> %s
+"""
+RELEASE_FIELD_CLAIMS_SQL = "DELETE FROM state_claims WHERE store = %s AND field = %s AND record_key = %s"
+INSERT_CLAIM_SQL = """
+    INSERT IGNORE INTO state_claims (store, field, claimed_value, record_key) VALUES (%s, %s, %s, %s)
+"""
+SELECT_CLAIM_SQL = """
+    SELECT record_key FROM state_claims WHERE store = %s AND field = %s AND claimed_value = %s FOR UPDATE
+"""
+
+state_commits_total = metrics.registry.counter(
+    "state_commits_total", "Request change sets saved to the shared state, by outcome", ("outcome",))
+state_commit_seconds = metrics.registry.histogram(
+    "state_commit_seconds", "Time spent saving one request's changes to the shared state")
+state_refreshed_records_total = metrics.registry.counter(
+    "state_refreshed_records_total", "Records changed by other workers and loaded into this one")
+
+# Item = (store name, record key)
+Item = Tuple[str, str]
+
+
+class StateConflict(Exception):
+    """Records saved by a request were changed by another worker first"""
+
+    def __init__(self, items: List[Item]):
+        super().__init__(f"{len(items)} records changed concurrently")
+        self.items = items
+
+
+class ChangeSet:
+    """The records changed while handling one request"""
+
+    def __init__(self):
+        self.items = {}
+        self.token = None
+
+
+_current_changes = contextvars.ContextVar('state_changes', default=None)
+
+
+class SharedStateBackend(StateBackend):
+    """State shared by several worker processes through MySQL.
+
+    Each worker keeps its stores in memory as before. Before a request it
+    loads records other workers changed since it last looked (one indexed
+    query on ``seq``), and after the request it saves the records the
+    request changed in one transaction. Every record carries a version: a
+    save only succeeds if the version is still the one this worker loaded,
+    and the values of the stores' unique fields are claimed in
+    ``state_claims``. Otherwise the whole request's changes are rolled
+    back, the records are reloaded and the client gets a 409 to retry.
+    """
+
+    shared = True
+
+    def __init__(self, database: Database, async_database: AsyncDatabase = async_db):
+        self.db = database
+        self.async_db = async_database
+        self._stores = {}
+        self._decoders = {}
+        # Version of each record as last loaded from or saved to the database
+        self._versions = {}
+        self._last_seq = 0
+        # Records changed by requests that have not committed yet
+        self._pending = {}
+        # Records whose in-memory state may differ from the saved one, after a
+        # failed commit; reloaded once no request is changing them, and any
+        # request that changed them meanwhile fails to commit
+        self._stale = set()
+        self._applying = False
+        self._stats = {'recovered': 0, 'refreshed': 0, 'commits': 0, 'conflicts': 0}
+
+    def register(self, name: str, store, decode: Optional[Callable[[Any], Any]] = None) -> None:
+        self._stores[name] = store
+        if decode is not None:
+            self._decoders[name] = decode
+        store.subscribe(lambda key, record: self._changed(name, key))
+
+    def _changed(self, name: str, key: str) -> None:
+        if self._applying:
+            return
+        item = (name, key)
+        changes = _current_changes.get()
+        if changes is None:
+            # Changed outside a request, so there is nothing to commit it with
+            self._write_now([item])
+            return
+        if item not in changes.items:
+            changes.items[item] = None
+            self._pending[item] = self._pending.get(item, 0) + 1
+
+    # --- loading ---
+
+    def recover(self) -> int:
+        """Load every saved record; raises if the database cannot be used yet.
+
+        Loading is idempotent, so a failed attempt can simply be retried.
+        """
+        if not self.db.connect():
+            raise RuntimeError("Shared state needs the database, which is unreachable")
+        if not self.db.migrate_schema():
+            raise RuntimeError("Shared state tables could not be created")
+
+        with self.db.get_cursor() as cursor:
+            # Rows written by the local backend use its own sequence numbers
+            cursor.execute("UPDATE state_sequence SET seq = GREATEST(seq, "
+                           "(SELECT COALESCE(MAX(seq), 0) FROM state_records)) WHERE id = 1")
+            # Read the sequence first: rows committed meanwhile are simply loaded twice
+            cursor.execute("SELECT seq FROM state_sequence WHERE id = 1")
+            last_seq = cursor.fetchone()['seq']
+            cursor.execute(SELECT_RECORDS_SQL)
+            rows = cursor.fetchall()
+
+        self._apply(rows, force=True)
+        self._last_seq = max(self._last_seq, last_seq)
+        self._claim_loaded()
+        restored = sum(len(store) for store in self._stores.values())
+        self._stats['recovered'] = restored
+        logger.info(f"Loaded {restored} shared state records (seq {self._last_seq})")
+        return restored
+
+    def _claim_loaded(self) -> None:
+        # Claims for records saved before state_claims existed
+        claims = []
+        for name, store in self._stores.items():
+            for field in store.unique_fields:
+                for key, record in store.items():
+                    value = record.get(field)
+                    if value is not None:
+                        claims.append((name, field, str(value), key))
+        if claims:
+            with self.db.get_cursor() as cursor:
+                cursor.executemany(INSERT_CLAIM_SQL, claims)
+
+    def _apply(self, rows: List[Dict[str, Any]], force: bool = False) -> int:
+        """Load rows into the stores; returns how many records changed.
+
+        Without ``force`` (a refresh) rows must come in ``seq`` order, and
+        ``_last_seq`` only moves past a row once it has been dealt with.
+        """
+        applied = 0
+        self._applying = True
+        try:
+            for row in rows:
+                item = (row['store'], row['record_key'])
+                store = self._stores.get(row['store'])
+                # Skip rows already seen, and records a request here is still
+                # changing; that request's commit will conflict and reload them
+                skip = store is None or not force and (
+                    row['version'] <= self._versions.get(item, 0) or self._pending.get(item))
+                if not skip:
+                    try:
+                        if row['data'] is None:
+                            store.pop(row['record_key'], None)
+                        else:
+                            record = json.loads(row['data'])
+                            decode = self._decoders.get(row['store'])
+                            store[row['record_key']] = decode(record) if decode is not None else record
+                    except DuplicateKeyError as e:
+                        # The value is still held here by a record that is not
+                        # saved (its claim will fail) or not reloaded yet, so the
+                        # row is tried again by a later refresh
+                        logger.warning(f"Deferring {item[0]}/{item[1]} v{row['version']}: {e}")
+                        if not force:
+                            break
+                        # Forget the version so the stale record cannot be saved over it
+                        self._versions.pop(item, None)
+                        self._last_seq = min(self._last_seq, row['seq'] - 1)
+                        continue
+                    self._versions[item] = row['version']
+                    applied += 1
+                if not force:
+                    self._last_seq = max(self._last_seq, row['seq'])
+        finally:
+            self._applying = False
+        return applied
+
+    async def refresh(self) -> None:
+        """Load records other workers changed since the last refresh"""
+        await self._reload_stale()
+        rows = await self.async_db.run(
+            self.db.execute_query, SELECT_RECORDS_SQL + " WHERE seq > %s ORDER BY seq", (self._last_seq,))
+        applied = self._apply(rows)
+        if applied:
+            self._stats['refreshed'] += applied
+            state_refreshed_records_total.inc(applied)
+
+    async def _reload_stale(self) -> None:
+        items = [item for item in self._stale if not self._pending.get(item)]
+        if not items:
+            return
+        self._stale.difference_update(items)
+        try:
+            await self._reload(items)
+        except BaseException:
+            self._stale.update(items)
+            raise
+
+    async def _reload(self, items: List[Item]) -> None:
+        """Replace ``items`` with their saved versions, dropping unsaved ones"""
+        conditions = " OR ".join(["(store = %s AND record_key = %s)"] * len(items))
+        params = tuple(value for item in items for value in item)
+        rows = await self.async_db.run(self.db.execute_query, f"{SELECT_RECORDS_SQL} WHERE {conditions}", params)
+        self._apply(rows, force=True)
+        saved = {(row['store'], row['record_key']) for row in rows}
+        self._applying = True
+        try:
+            for name, key in items:
+                if (name, key) not in saved:
+                    self._stores[name].pop(key, None)
+                    self._versions.pop((name, key), None)
+        finally:
+            self._applying = False
+
+    # --- saving ---
+
+    def track_changes(self) -> ChangeSet:
+        """Start collecting the changes of the current request"""
+        changes = ChangeSet()
+        changes.token = _current_changes.set(changes)
+        return changes
+
+    def _payload(self, items: List[Item]) -> List[Tuple[str, str, Optional[str], Optional[int], Dict[str, Any]]]:
+        payload = []
+        for name, key in items:
+            store = self._stores[name]
+            record = store.get(key)
+            text = None if record is None else encode_record(record)
+            # Unique field -> value the record holds now (None releases the claim)
+            claims = {field: None if record is None else record.get(field) for field in store.unique_fields}
+            payload.append((name, key, text, self._versions.get((name, key)), claims))
+        return payload
+
+    def _claim(self, cursor, name: str, key: str, claims: Dict[str, Any]) -> bool:
+        """Claim the record's unique values and release its old ones; False if taken"""
+        for field, value in claims.items():
+            if value is None:
+                cursor.execute(RELEASE_FIELD_CLAIMS_SQL, (name, field, key))
+                continue
+            value = str(value)
+            cursor.execute(RELEASE_CLAIMS_SQL, (name, field, key, value))
+            cursor.execute(INSERT_CLAIM_SQL, (name, field, value, key))
+            if cursor.rowcount == 0:
+                cursor.execute(SELECT_CLAIM_SQL, (name, field, value))
+                holder = cursor.fetchone()
+                if holder is not None and holder['record_key'] != key:
+                    return False
+        return True
+
+    def _write(self, payload) -> Dict[Item, int]:
+        """Save records in one transaction; returns their new versions"""
+        versions = {}
+        conflicts = []
+        with self.db.get_cursor() as cursor:
+            cursor.execute(NEXT_SEQ_SQL)
+            cursor.execute("SELECT LAST_INSERT_ID() AS seq")
+            seq = cursor.fetchone()['seq']
+            for name, key, text, version, claims in payload:
+                if version is None:
+                    if text is None:
+                        # Created and deleted again before it was ever saved
+                        continue
+                    try:
+                        cursor.execute(INSERT_RECORD_SQL, (name, key, text, seq))
+                    except IntegrityError:
+                        conflicts.append((name, key))
+                        continue
+                    versions[(name, key)] = 1
+                else:
+                    cursor.execute(UPDATE_RECORD_SQL, (text, seq, name, key, version))
+                    if cursor.rowcount != 1:
+                        conflicts.append((name, key))
+                        continue
+                    versions[(name, key)] = version + 1
+                if not self._claim(cursor, name, key, claims):
+                    conflicts.append((name, key))
+            if conflicts:
+                # Leaving the block with an exception rolls the transaction back
+                raise StateConflict(conflicts)
+        return versions
+
+    def _write_now(self, items: List[Item]) -> None:
+        try:
+            self._versions.update(self._write(self._payload(items)))
+        except StateConflict as e:
+            logger.error(f"Change made outside a request lost to a concurrent update: {e.items}")
+
+    async def commit(self, changes: ChangeSet) -> bool:
+        _current_changes.reset(changes.token)
+        items = list(changes.items)
+        if not items:
+            return True
+
+        started = time.perf_counter()
+        try:
+            stale = [item for item in items if item in self._stale]
+            if stale:
+                # Another request's failed changes may be mixed into these records
+                raise StateConflict(stale)
+            versions = await self.async_db.run(self._write, self._payload(items))
+        except StateConflict:
+            self._stats['conflicts'] += 1
+            state_commits_total.inc(outcome="conflict")
+            self._stale.update(items)
+            self._release(items)
+            await self._reload_stale()
+            return False
+        except BaseException:
+            self._stale.update(items)
+            self._release(items)
+            raise
+        self._versions.update(versions)
+        self._release(items)
+        self._stats['commits'] += 1
+        state_commits_total.inc(outcome="committed")
+        state_commit_seconds.observe(time.perf_counter() - started)
+        return True
+
+    def _release(self, items: List[Item]) -> None:
+        for item in items:
+            remaining = self._pending.get(item, 0) - 1
+            if remaining > 0:
+                self._pending[item] = remaining
+            else:
+                self._pending.pop(item, None)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'backend': 'mysql',
+            **self._stats,
+            'seq': self._last_seq,
+            'records': {name: len(store) for name, store in self._stores.items()},
+            'uncommitted': len(self._pending),
+            'stale': len(self._stale),
+        }
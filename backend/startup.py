@@ -0,0 +1,82 @@
+import time
+import logging
+import threading
+from typing import Dict, Any, Callable
+
+from database import ensure_data_loaded
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Runs a slow startup step (``load``) on a background thread.
+
+    The web server starts serving immediately; ``ready`` turns true once
+    ``load`` has returned true. A failed attempt (for example MySQL still
+    starting) is retried with a growing delay until it succeeds or ``stop``
+    is called.
+    """
+
+    def __init__(self, name: str, load: Callable[[], bool],
+                 retry_delay: float = 5.0, max_retry_delay: float = 60.0):
+        self.name = name
+        self.load = load
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.state = "starting"
+        self.attempts = 0
+        self.started_at = None
+        self.ready_at = None
+        self.last_error = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        delay = self.retry_delay
+        while not self._stop.is_set():
+            self.attempts += 1
+            self.state = "loading"
+            try:
+                loaded = self.load()
+                self.last_error = None if loaded else f"{self.name.capitalize()} could not be loaded"
+            except Exception as e:
+                logger.exception(f"{self.name.capitalize()} warm-up failed")
+                loaded = False
+                self.last_error = str(e)
+
+            if loaded:
+                self.ready_at = time.time()
+                self.state = "ready"
+                logger.info(f"{self.name.capitalize()} ready after {self.ready_at - self.started_at:.1f}s")
+                return
+
+            self.state = "retrying"
+            logger.warning(f"{self.name.capitalize()} warm-up attempt {self.attempts} failed; retrying in {delay:.0f} seconds")
+            self._stop.wait(delay)
+            delay = min(delay * 2, self.max_retry_delay)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "status": self.state,
+            "attempts": self.attempts,
+            "error": self.last_error,
+            "startup_seconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+        }
+
+
+# Schema setup and CSV loading
+catalog_warmup = Warmup("catalog", ensure_data_loaded)
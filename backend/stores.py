@@ -0,0 +1,126 @@
+import threading
+from collections.abc import MutableMapping
+from typing import Dict, Any, Optional, Iterable, Iterator, List, Tuple, Callable
+
+
+class DuplicateKeyError(ValueError):
+    """A record would reuse a value of a unique index"""
+
+
+class IndexedStore(MutableMapping):
+    """Dict of id -> record (a dict) with secondary indexes on record fields.
+
+    Behaves like the plain dicts it replaces, and keeps its indexes in step
+    on every insert, replace and delete. ``unique`` fields map one value to
+    one id and reject duplicates; ``multi`` fields map a value to the ids
+    holding it, in insertion order. A record that is changed in place must
+    be passed to ``touch`` so the indexes and listeners see the change.
+
+    Listeners registered with ``subscribe`` are called with ``(key, record)``
+    after every change; ``record`` is None when the key was deleted.
+    """
+
+    def __init__(self, name: str, unique: Iterable[str] = (), multi: Iterable[str] = ()):
+        self.name = name
+        self._data = {}
+        self._unique = {field: {} for field in unique}
+        self._multi = {field: {} for field in multi}
+        # Index entries of each record as last seen, so they can be removed later
+        self._indexed = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+
+    def __getitem__(self, key: str) -> Dict[str, Any]:
+        return self._data[key]
+
+    def __setitem__(self, key: str, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._check_unique(key, record)
+            self._unindex(key)
+            self._data[key] = record
+            self._index(key, record)
+        self._notify(key, record)
+
+    def __delitem__(self, key: str) -> None:
+        with self._lock:
+            del self._data[key]
+            self._unindex(key)
+        self._notify(key, None)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._data
+
+    def __repr__(self) -> str:
+        return f"IndexedStore({self.name!r}, {len(self._data)} records)"
+
+    def _check_unique(self, key: str, record: Dict[str, Any]) -> None:
+        for field, index in self._unique.items():
+            value = record.get(field)
+            owner = index.get(value) if value is not None else None
+            if owner is not None and owner != key:
+                raise DuplicateKeyError(f"{self.name}: {field}={value!r} is already used by {owner}")
+
+    def _index(self, key: str, record: Dict[str, Any]) -> None:
+        entries = []
+        for field, index in self._unique.items():
+            value = record.get(field)
+            if value is not None:
+                index[value] = key
+                entries.append((field, value))
+        for field, index in self._multi.items():
+            value = record.get(field)
+            if value is not None:
+                index.setdefault(value, {})[key] = None
+                entries.append((field, value))
+        self._indexed[key] = entries
+
+    def _unindex(self, key: str) -> None:
+        for field, value in self._indexed.pop(key, ()):
+            if field in self._unique:
+                self._unique[field].pop(value, None)
+            else:
+                keys = self._multi[field].get(value)
+                if keys is not None:
+                    keys.pop(key, None)
+                    if not keys:
+                        del self._multi[field][value]
+
+    def touch(self, key: str) -> None:
+        """Re-index and announce a record after it was changed in place"""
+        with self._lock:
+            record = self._data[key]
+            self._check_unique(key, record)
+            self._unindex(key)
+            self._index(key, record)
+        self._notify(key, record)
+
+    @property
+    def unique_fields(self) -> Tuple[str, ...]:
+        return tuple(self._unique)
+
+    def subscribe(self, listener: Callable[[str, Optional[Dict[str, Any]]], None]) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, key: str, record: Optional[Dict[str, Any]]) -> None:
+        for listener in self._listeners:
+            listener(key, record)
+
+    def get_by(self, field: str, value: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """(id, record) whose unique ``field`` equals ``value``, or None"""
+        key = self._unique[field].get(value)
+        if key is None:
+            return None
+        return key, self._data[key]
+
+    def has_value(self, field: str, value: Any) -> bool:
+        return value in self._unique[field]
+
+    def find(self, field: str, value: Any) -> List[str]:
+        """Ids of records whose ``field`` equals ``value`` (multi index)"""
+        return list(self._multi[field].get(value, ()))
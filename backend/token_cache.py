@@ -0,0 +1,85 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+class VerifiedTokenCache:
+    """Bounded cache of bearer tokens whose signature was already verified.
+
+    Entries are keyed by the SHA-256 digest of the token, so raw tokens are
+    never kept in memory, and expire at the token's own ``exp``. Each entry
+    holds the resolved user; ``invalidate_user`` drops every token of a
+    user whose record changed.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # digest -> (expires_at, user_id, user)
+        self._by_user = {}  # user_id -> set of digests
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            expires_at, user_id, user = entry
+            if expires_at <= time.time():
+                self._remove(digest)
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(digest)
+            self._stats['hits'] += 1
+            return user
+
+    def put(self, token: str, user: Dict[str, Any], expires_at: Optional[float]) -> None:
+        # Tokens without an expiry are verified every time
+        if expires_at is None or expires_at <= time.time():
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._remove(digest)
+            self._entries[digest] = (expires_at, user["id"], user)
+            self._by_user.setdefault(user["id"], set()).add(digest)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def _remove(self, digest: bytes) -> None:
+        entry = self._entries.pop(digest, None)
+        if entry is None:
+            return
+        digests = self._by_user.get(entry[1])
+        if digests is not None:
+            digests.discard(digest)
+            if not digests:
+                del self._by_user[entry[1]]
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            digests = self._by_user.pop(user_id, ())
+            for digest in digests:
+                self._entries.pop(digest, None)
+            if digests:
+                self._stats['invalidations'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+        return stats
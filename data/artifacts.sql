@@ -6,7 +6,7 @@ CREATE TABLE IF NOT EXISTS artifacts (
     id VARCHAR(20) PRIMARY KEY,
     name VARCHAR(100) NOT NULL,
     property TEXT,
-    source ENUM('gravitational anomlaies',
+    source ENUM('gravitational anomalies',
                 'thermal anomalies',
                 'electric anomalies',
                 'toxic anomalies'),